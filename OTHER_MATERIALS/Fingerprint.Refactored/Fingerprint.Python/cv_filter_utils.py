@@ -136,12 +136,14 @@ def angle_mean(a: float, b: float) -> float:
 
 
 def calculate_minutiae(mask: np.ndarray, skeleton: np.ndarray, binary_skeleton: np.ndarray):
-    crossed_number = np.array(crossing_number_kernel())
-    chebyshev = chebyshev_kernel()
-    euclidean = euclidean_kernel()
-    crossing_numbers = np.array([np.count_nonzero(n < np.roll(n, -1)) for n in chebyshev]).astype(np.uint8)
-    chebyshev_filter_applied = cv2.filter2D(binary_skeleton, -1, crossed_number, borderType=cv2.BORDER_CONSTANT)
-    crossing_numbers_transformed = cv2.LUT(chebyshev_filter_applied, crossing_numbers)
+    from minutiae_tables import get_extractor_tables
+
+    tables = get_extractor_tables()
+    euclidean = tables.euclidean
+    next_directions = tables.next_directions
+    chebyshev_filter_applied = cv2.filter2D(binary_skeleton, -1, tables.crossing_number_kernel,
+                                            borderType=cv2.BORDER_CONSTANT)
+    crossing_numbers_transformed = cv2.LUT(chebyshev_filter_applied, tables.crossing_numbers)
     crossing_numbers_transformed[skeleton == 0] = 0
     minutiae = [(x, y, crossing_numbers_transformed[y, x] == 1)
                 for y, x
@@ -151,9 +153,6 @@ def calculate_minutiae(mask: np.ndarray, skeleton: np.ndarray, binary_skeleton:
         cv2.DIST_C,
         3)[1:-1, 1:-1]
     filtered_minutiae = list(filter(lambda m: mask_distance[m[1], m[0]] > 10, minutiae))
-    next_directions = [[next_ridge_directions(previous_distance, neighbour) for previous_distance in range(9)]
-                       for neighbour
-                       in chebyshev]
 
     def get_ridge_angle(x, y, direction=8):
         current_x, current_y, current_distance = x, y, direction
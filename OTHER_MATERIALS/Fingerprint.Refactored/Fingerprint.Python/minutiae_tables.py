@@ -0,0 +1,72 @@
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+from cv_filter_utils import chebyshev_kernel, crossing_number_kernel, euclidean_kernel, next_ridge_directions
+
+# Направление 8 - "без предыдущего шага" (старт трассировки из окончания)
+NO_DIRECTION = 8
+
+
+@dataclass(frozen=True)
+class MinutiaeExtractorTables:
+    """
+    Image-independent lookup tables of minutiae extraction, built once per process.
+
+    Shared read-only by every image (and thread); the arrays must not be modified.
+
+    Attributes:
+        crossing_number_kernel: 3×3 filter2D kernel giving each skeleton pixel its 8-neighbourhood code
+        chebyshev: uint8 [256, 8] neighbour bits of every code (chebyshev_kernel)
+        crossing_numbers: uint8 [256] crossing number of every code, the cv2.LUT table
+        next_directions: Nested lists [256][9] of next_ridge_directions for the Python ridge walk
+        direction_table: int8 [256, 9, 8] dense next_directions padded with -1 for compiled kernels
+        euclidean: (dx, dy, length) steps of euclidean_kernel for the Python ridge walk
+        step_x, step_y, step_length: euclidean_kernel steps as int32/int32/float64 arrays
+    """
+    crossing_number_kernel: np.ndarray
+    chebyshev: np.ndarray
+    crossing_numbers: np.ndarray
+    next_directions: list
+    direction_table: np.ndarray
+    euclidean: list
+    step_x: np.ndarray
+    step_y: np.ndarray
+    step_length: np.ndarray
+
+    @classmethod
+    def build(cls) -> 'MinutiaeExtractorTables':
+        chebyshev = chebyshev_kernel()
+        next_directions = [[next_ridge_directions(previous_direction, neighbours)
+                            for previous_direction in range(NO_DIRECTION + 1)]
+                           for neighbours in chebyshev]
+        direction_table = np.full((256, NO_DIRECTION + 1, 8), -1, dtype=np.int8)
+        for code, directions_by_previous in enumerate(next_directions):
+            for previous_direction, directions in enumerate(directions_by_previous):
+                direction_table[code, previous_direction, :len(directions)] = directions
+        steps = euclidean_kernel()
+        return cls(
+            crossing_number_kernel=np.array(crossing_number_kernel()),
+            chebyshev=np.array(chebyshev, dtype=np.uint8),
+            crossing_numbers=np.array([np.count_nonzero(n < np.roll(n, -1)) for n in chebyshev]).astype(np.uint8),
+            next_directions=next_directions,
+            direction_table=direction_table,
+            euclidean=steps,
+            step_x=np.array([step[0] for step in steps], dtype=np.int32),
+            step_y=np.array([step[1] for step in steps], dtype=np.int32),
+            step_length=np.array([step[2] for step in steps], dtype=np.float64)
+        )
+
+
+_tables = None
+_tables_lock = threading.Lock()
+
+
+def get_extractor_tables() -> MinutiaeExtractorTables:
+    """Returns the process-wide tables, building them on first use."""
+    global _tables
+    with _tables_lock:
+        if _tables is None:
+            _tables = MinutiaeExtractorTables.build()
+        return _tables
@@ -2,19 +2,34 @@
 import os
 import base64
 import logging
+import threading
 import time
+import shutil
 import traceback
+from functools import partial
+from typing import TYPE_CHECKING, NamedTuple
+
+_init_started = time.perf_counter()
 
 import boto3
 from boto3.dynamodb.conditions import Key
 import numpy as np
 from minutia_types import MINUTIA_DTYPE_BASE, assign_unique_ids
-from minutia_comparison import compare_images
-from score_aggregation import aggregate_group_scores, evaluate_thresholds
+from template_codec import decode_minutiae, is_encoded_template, is_legacy_npz
+from score_aggregation import IncrementalGroupAggregator
+from gallery_loader import GalleryPrefetcher, get_loader_pool
+from comparison_metrics import get_metrics, start_invocation_metrics
+
+# Модули с Numba (minutia_comparison и зависящие от него) импортируются лениво:
+# при инициализации контейнера (initialize_comparator) или при первом probe
+if TYPE_CHECKING:
+    from minutia_comparison import MinutiaTemplate
+    from template_cache import GalleryTemplateCache
 
 # Configure logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+# LOG_LEVEL=DEBUG включает логирование по каждой gallery и каждой группе
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 handler = logging.StreamHandler()
 handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
 logger.addHandler(handler)
@@ -22,6 +37,9 @@ logger.addHandler(handler)
 def validate_binary_data(binary_data: bytes, dtype, field_name: str) -> np.ndarray:
     """
     Validates and creates NumPy array from binary data with detailed error reporting.
+
+    Templates written through template_codec (and legacy npz items) are decoded by the codec;
+    anything else is treated as raw dtype records.
     
     Args:
         binary_data: Raw binary data
@@ -36,12 +54,20 @@ def validate_binary_data(binary_data: bytes, dtype, field_name: str) -> np.ndarr
     """
     if not binary_data:
         raise ValueError(f"{field_name}: Binary data is empty")
+
+    if is_encoded_template(binary_data) or is_legacy_npz(binary_data):
+        try:
+            return decode_minutiae(binary_data)
+        except Exception as e:
+            logger.error(f"{field_name}: Failed to decode template: {str(e)}")
+            raise ValueError(f"{field_name}: Failed to decode template: {str(e)}")
     
     element_size = dtype.itemsize
     data_size = len(binary_data)
     
-    logger.info(f"{field_name}: Data size = {data_size} bytes, Element size = {element_size} bytes")
-    logger.info(f"{field_name}: dtype details = {dtype}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{field_name}: Data size = {data_size} bytes, Element size = {element_size} bytes")
+        logger.debug(f"{field_name}: dtype details = {dtype}")
     
     if data_size % element_size != 0:
         expected_elements = data_size // element_size
@@ -66,7 +92,8 @@ def validate_binary_data(binary_data: bytes, dtype, field_name: str) -> np.ndarr
     
     try:
         array = np.frombuffer(binary_data, dtype=dtype)
-        logger.info(f"{field_name}: Successfully created array with {len(array)} elements")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{field_name}: Successfully created array with {len(array)} elements")
         return array
     except Exception as e:
         logger.error(f"{field_name}: Failed to create NumPy array: {str(e)}")
@@ -93,172 +120,499 @@ def safe_decode_base64(data_b64: str, field_name: str) -> bytes:
             logger.warning(f"{field_name}: Base64 string length is not multiple of 4, padding may be missing")
         
         decoded = base64.b64decode(data_b64)
-        logger.info(f"{field_name}: Successfully decoded {len(data_b64)} base64 chars to {len(decoded)} bytes")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{field_name}: Successfully decoded {len(data_b64)} base64 chars to {len(decoded)} bytes")
         return decoded
     except Exception as e:
         logger.error(f"{field_name}: Failed to decode base64 data: {str(e)}")
         raise ValueError(f"{field_name}: Failed to decode base64 data: {str(e)}")
 
 
+# Кэш списка групп на время жизни контейнера
+_group_ids_cache = {'group_ids': None, 'expires_at': 0.0}
+# boto3 resources are not thread-safe, so every thread gets its own
+_thread_local = threading.local()
+
+
+def get_dynamodb_resource():
+    """
+    Returns a DynamoDB resource owned by the calling thread.
+
+    DYNAMODB_ENDPOINT_URL points the comparator at a local DynamoDB stand-in.
+    """
+    if not hasattr(_thread_local, 'dynamodb'):
+        _thread_local.dynamodb = boto3.session.Session().resource(
+            'dynamodb', endpoint_url=os.environ.get('DYNAMODB_ENDPOINT_URL'))
+    return _thread_local.dynamodb
+
+
+def scan_group_ids(table, attribute: str = 'GroupId') -> set:
+    """
+    Collects distinct group IDs from a table with a GroupId projection scan.
+
+    Args:
+        table: DynamoDB table resource
+        attribute: Attribute holding the group ID
+
+    Returns:
+        Set of group IDs
+    """
+    scan_response = table.scan(ProjectionExpression=attribute)
+    group_ids = set(item[attribute] for item in scan_response['Items'] if attribute in item)
+    while 'LastEvaluatedKey' in scan_response:
+        scan_response = table.scan(ProjectionExpression=attribute,
+                                   ExclusiveStartKey=scan_response['LastEvaluatedKey'])
+        group_ids.update(item[attribute] for item in scan_response['Items'] if attribute in item)
+    return group_ids
+
+
+def list_group_ids(dynamodb, minutiae_table) -> list:
+    """
+    Returns the known group IDs, cached in memory for GROUP_IDS_TTL_SECONDS.
+
+    Group IDs are read from the groups table (GROUPS_TABLE_NAME) that the extractor maintains
+    through save_group_to_dynamo, so discovery is O(groups). Without GROUPS_TABLE_NAME the
+    minutiae table is scanned instead.
+
+    Args:
+        dynamodb: boto3 DynamoDB resource
+        minutiae_table: Minutiae table resource (fallback source)
+
+    Returns:
+        Sorted list of group IDs
+    """
+    now = time.time()
+    if _group_ids_cache['group_ids'] is not None and now < _group_ids_cache['expires_at']:
+        return _group_ids_cache['group_ids']
+
+    groups_table_name = os.environ.get('GROUPS_TABLE_NAME')
+    with get_metrics().timed('scan'):
+        if groups_table_name:
+            group_ids = scan_group_ids(dynamodb.Table(groups_table_name))
+        else:
+            logger.warning("GROUPS_TABLE_NAME is not set, scanning minutiae table for group IDs")
+            group_ids = scan_group_ids(minutiae_table)
+
+    _group_ids_cache['group_ids'] = sorted(group_ids)
+    _group_ids_cache['expires_at'] = now + int(os.environ.get('GROUP_IDS_TTL_SECONDS', '300'))
+    return _group_ids_cache['group_ids']
+
+
+def decode_gallery_template(item: dict) -> 'MinutiaTemplate':
+    """
+    Decodes a gallery item into a comparison-ready template.
+
+    Args:
+        item: DynamoDB item with ImageId, MinutiaeBinary and Metadata
+
+    Returns:
+        MinutiaTemplate with IDs assigned from 0 (IDs only need to be unique within a template)
+    """
+    from minutia_comparison import build_template
+
+    image_id = item['ImageId']
+    with get_metrics().timed('decode'):
+        binary = safe_decode_base64(item['MinutiaeBinary']['B'], f"Gallery {image_id}")
+        minutiae = validate_binary_data(binary, MINUTIA_DTYPE_BASE, f"Gallery {image_id}")
+        metadata = item['Metadata']['M']
+        center = (int(metadata['center_x']['N']), int(metadata['center_y']['N']))
+        minutiae, _ = assign_unique_ids(minutiae, 0)
+    return build_template(minutiae, center)
+
+
+def batch_get_items(dynamodb, table_name: str, image_ids: list) -> list:
+    """
+    Reads full items by ImageId with BatchGetItem, retrying unprocessed keys.
+
+    Unprocessed keys are retried with exponential backoff up to BATCH_GET_MAX_ATTEMPTS requests
+    per chunk of 100 keys (default 8, about 4.5 s of backoff).
+
+    Args:
+        dynamodb: boto3 DynamoDB resource
+        table_name: Table to read from
+        image_ids: ImageIds to fetch
+
+    Returns:
+        List of items (order is not preserved)
+
+    Raises:
+        RuntimeError: If keys are still unprocessed after the last attempt
+    """
+    max_attempts = max(1, int(os.environ.get('BATCH_GET_MAX_ATTEMPTS', '8')))
+    items = []
+    for start in range(0, len(image_ids), 100):
+        request = {table_name: {'Keys': [{'ImageId': image_id} for image_id in image_ids[start:start + 100]]}}
+        attempt = 0
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(response['Responses'].get(table_name, []))
+            request = response.get('UnprocessedKeys') or None
+            if request:
+                attempt += 1
+                if attempt >= max_attempts:
+                    # Группа не загружена - её probe уходят в batchItemFailures и повторяются
+                    unprocessed = len(request.get(table_name, {}).get('Keys', []))
+                    raise RuntimeError(f"BatchGetItem on {table_name}: {unprocessed} keys still unprocessed "
+                                       f"after {attempt} attempts")
+                time.sleep(min(0.05 * 2 ** attempt, 1.0))
+    return items
+
+
+def load_group_templates(dynamodb, minutiae_table, group_id: str, template_cache: 'GalleryTemplateCache',
+                         skip_image_ids: frozenset = frozenset()) -> list:
+    """
+    Loads gallery templates of a group, reading from DynamoDB only what the cache lacks.
+
+    The group is queried with an ImageId/Timestamp projection; galleries whose Timestamp matches the
+    cached version are served from the template cache, the rest are fetched with BatchGetItem,
+    decoded and cached.
+
+    Args:
+        dynamodb: boto3 DynamoDB resource
+        minutiae_table: Minutiae table resource
+        group_id: Group to load
+        template_cache: Process-level gallery template cache
+        skip_image_ids: ImageIds to leave out (the probes themselves)
+
+    Returns:
+        List of (image_id, template) in query order; template is None if the gallery failed to decode
+    """
+    metrics = get_metrics()
+    query_started = time.perf_counter()
+    versions = {}
+    query_kwargs = {
+        'KeyConditionExpression': Key('GroupId').eq(group_id),
+        'ProjectionExpression': 'ImageId, #ts',
+        'ExpressionAttributeNames': {'#ts': 'Timestamp'}
+    }
+    query_response = minutiae_table.query(**query_kwargs)
+    versions.update((item['ImageId'], item.get('Timestamp')) for item in query_response['Items'])
+    while 'LastEvaluatedKey' in query_response:
+        query_response = minutiae_table.query(ExclusiveStartKey=query_response['LastEvaluatedKey'], **query_kwargs)
+        versions.update((item['ImageId'], item.get('Timestamp')) for item in query_response['Items'])
+    metrics.add_time('query', (time.perf_counter() - query_started) * 1000)
+    for image_id in skip_image_ids:
+        versions.pop(image_id, None)
+
+    templates = {}
+    missing_ids = []
+    for image_id, version in versions.items():
+        template = template_cache.get(image_id, version)
+        if template is None:
+            missing_ids.append(image_id)
+        else:
+            templates[image_id] = template
+
+    with metrics.timed('query'):
+        items = batch_get_items(dynamodb, minutiae_table.name, missing_ids)
+    for item in items:
+        image_id = item['ImageId']
+        try:
+            template = decode_gallery_template(item)
+        except Exception as e:
+            logger.error(f"Failed to decode gallery {image_id}: {str(e)}")
+            continue
+        template_cache.put(image_id, item.get('Timestamp'), template)
+        templates[image_id] = template
+
+    metrics.count('galleries_loaded', len(versions))
+    metrics.count('template_cache_hits', len(versions) - len(missing_ids))
+    logger.debug(f"Group {group_id}: {len(versions)} galleries, {len(versions) - len(missing_ids)} from cache")
+    return [(image_id, templates.get(image_id)) for image_id in versions]
+
+
+def load_group_templates_threaded(table_name: str, group_id: str, template_cache: 'GalleryTemplateCache',
+                                  skip_image_ids: frozenset = frozenset()) -> list:
+    """Loader-thread variant of load_group_templates using the thread's own DynamoDB resource."""
+    dynamodb = get_dynamodb_resource()
+    return load_group_templates(dynamodb, dynamodb.Table(table_name), group_id, template_cache, skip_image_ids)
+
+
+class StreamProbe(NamedTuple):
+    item_identifier: str  # SequenceNumber записи потока, для batchItemFailures
+    image_id: str
+    template: 'MinutiaTemplate'
+
+
+def parse_probe_record(record: dict) -> StreamProbe:
+    """
+    Decodes the probe carried by a DynamoDB stream INSERT record.
+
+    Args:
+        record: Stream record with NewImage
+
+    Returns:
+        StreamProbe with the record's sequence number, probe ImageId and template
+    """
+    from minutia_comparison import build_template
+
+    new_image = record['dynamodb']['NewImage']
+    probe_image_id = new_image['ImageId']['S']
+
+    with get_metrics().timed('decode'):
+        # Безопасное декодирование данных probe
+        probe_binary = safe_decode_base64(new_image['MinutiaeBinary']['B'], f"Probe {probe_image_id}")
+        probe_minutiae = validate_binary_data(probe_binary, MINUTIA_DTYPE_BASE, f"Probe {probe_image_id}")
+
+        # Обработка метаданных
+        metadata = new_image['Metadata']['M']
+        probe_center = (int(metadata['center_x']['N']), int(metadata['center_y']['N']))
+
+        probe_minutiae, _ = assign_unique_ids(probe_minutiae, 0)
+    return StreamProbe(record['dynamodb']['SequenceNumber'], probe_image_id,
+                       build_template(probe_minutiae, probe_center))
+
+
+def score_group(probe_template: 'MinutiaTemplate', galleries: list, prefilter) -> tuple:
+    """
+    Compares a probe against the galleries of one group and evaluates the thresholds.
+
+    Args:
+        probe_template: Probe template
+        galleries: List of (image_id, template) from load_group_templates
+        prefilter: PrefilterCascade applied before matching
+
+    Returns:
+        Tuple (result, successful_comparisons, pruned, saved) where result is "YES" or "NO" and saved is
+        the number of comparisons skipped once the outcome was settled
+    """
+    from minutia_comparison import compare_templates
+
+    aggregator = IncrementalGroupAggregator(len(galleries))
+    # Не удалось декодировать gallery - она учитывается только в group_size
+    candidates = [(image_id, template) for image_id, template in galleries if template is not None]
+    for _ in range(len(galleries) - len(candidates)):
+        aggregator.add(None)
+    candidates, pruned = prefilter.filter(probe_template, candidates)
+    # Отсеянные префильтром gallery считаются сравнениями с нулевой оценкой
+    for _ in pruned:
+        aggregator.add(0.0)
+
+    compared = 0
+    for gallery_image_id, gallery_template in candidates:
+        # Оставшиеся gallery уже не могут изменить результат
+        if aggregator.decided:
+            break
+        compared += 1
+        try:
+            score = compare_templates(probe_template, gallery_template)
+        except Exception as e:
+            logger.error(f"Failed to process gallery {gallery_image_id}: {str(e)}")
+            score = None  # Пропускаем эту gallery и продолжаем
+        aggregator.add(score)
+
+    metrics = get_metrics()
+    metrics.count('comparisons', compared)
+    metrics.count('galleries_pruned', len(pruned))
+    metrics.count('early_exit_saved', aggregator.saved)
+    result = "YES" if aggregator.decision else "NO"
+    return result, aggregator.valid_count, len(pruned), aggregator.saved
+
+
+def write_results(results_table, results: list) -> None:
+    """
+    Writes result items through a buffered batch writer (25 items per BatchWriteItem,
+    unprocessed items are resent by the writer).
+
+    Args:
+        results_table: ResultsTable resource
+        results: List of {'ImageId', 'GroupId', 'Result'} items
+    """
+    with results_table.batch_writer() as writer:
+        for item in results:
+            writer.put_item(Item=item)
+
+
+def batch_item_failures(item_identifiers) -> dict:
+    """Builds the partial batch response so the stream retries only the failed records."""
+    return {'batchItemFailures': [{'itemIdentifier': identifier} for identifier in item_identifiers]}
+
+
+def prepare_numba_cache() -> None:
+    """
+    Seeds NUMBA_CACHE_DIR from the kernel cache compiled into the image.
+
+    Numba only uses writable cache directories and the task root is read-only, so the bundled
+    numba_cache directory is copied to NUMBA_CACHE_DIR (under /tmp) before Numba is imported.
+    """
+    cache_dir = os.environ.get('NUMBA_CACHE_DIR')
+    bundled_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'numba_cache')
+    if not cache_dir or os.path.abspath(cache_dir) == bundled_dir or os.path.isdir(cache_dir):
+        return
+    if os.path.isdir(bundled_dir):
+        shutil.copytree(bundled_dir, cache_dir)
+
+
+def initialize_comparator() -> dict:
+    """
+    Imports the matching stack, loads the Numba kernels and warms them up during container init.
+
+    NUMBA_CACHE_DIR must already be seeded (prepare_numba_cache) so the kernels load from the cache.
+
+    Returns:
+        Dict of init phase durations in milliseconds
+    """
+    timings = {}
+    started = time.perf_counter()
+    # Ядра с явными сигнатурами компилируются (или читаются из кэша) при импорте
+    import minutia_comparison
+    import candidate_prefilter, score_cache, template_cache  # noqa: F401
+    timings['import_ms'] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    minutia_comparison.warm_up()
+    timings['warmup_ms'] = (time.perf_counter() - started) * 1000
+    return timings
+
+
+# Инициализация контейнера: Lambda выполняет её до первого вызова.
+# Кэш ядер готовится всегда, чтобы и отложенный импорт читал ядра из кэша, а не компилировал их;
+# COMPARATOR_WARMUP=0 откладывает только импорт Numba и прогрев до первого пакета с INSERT
+_cold_start = {'warmup': os.environ.get('COMPARATOR_WARMUP', '1') != '0'}
+_numba_cache_started = time.perf_counter()
+prepare_numba_cache()
+_cold_start['numba_cache_ms'] = (time.perf_counter() - _numba_cache_started) * 1000
+if _cold_start['warmup']:
+    _cold_start.update(initialize_comparator())
+_cold_start['init_ms'] = (time.perf_counter() - _init_started) * 1000
+_invocation_count = 0
+
+
+def _cold_start_summary() -> dict:
+    return {key: round(value, 1) if isinstance(value, float) else value for key, value in _cold_start.items()}
+
+
+def log_invocation_summary(summary: dict, metrics) -> None:
+    """Logs the one structured summary line of an invocation: outcome counts, stage timings and counters."""
+    summary.update(metrics.summary())
+    logger.info(f"Invocation summary: {json.dumps(summary)}")
+
+
 def lambda_handler(event, context):
     """
     AWS Lambda handler for processing DynamoDB stream inserts.
 
-    Processes probe insertion, compares against all groups, aggregates scores,
-    evaluates thresholds, writes "YES"/"NO" to ResultsTable, and deletes probe.
+    Collects all probe insertions of the batch, loads every group's galleries once, compares all
+    probes against them, aggregates scores, evaluates thresholds, writes "YES"/"NO" to ResultsTable
+    and deletes the completed probes.
+
+    Returns a partial batch response: only records whose probe could not be fully processed are
+    listed in batchItemFailures (requires ReportBatchItemFailures on the event source mapping).
     """
+    global _invocation_count
+    _invocation_count += 1
+    metrics = start_invocation_metrics()
+    summary = {
+        'request_id': context.aws_request_id,
+        'records': len(event.get('Records', [])),
+        # Первый вызов контейнера - в сводку попадает длительность холодного старта
+        'cold_start': _cold_start_summary() if _invocation_count == 1 else False
+    }
     logger.info(f"Lambda handler started. Request ID: {context.aws_request_id}")
-    logger.info(f"Event contains {len(event.get('Records', []))} records")
-    
-    # Логируем информацию о dtype
-    logger.info(f"MINUTIA_DTYPE_BASE itemsize: {MINUTIA_DTYPE_BASE.itemsize} bytes")
-    logger.info(f"MINUTIA_DTYPE_BASE fields: {MINUTIA_DTYPE_BASE.names}")
-    logger.info(f"MINUTIA_DTYPE_BASE descr: {MINUTIA_DTYPE_BASE.descr}")
+    logger.debug(f"MINUTIA_DTYPE_BASE: itemsize {MINUTIA_DTYPE_BASE.itemsize} bytes, descr {MINUTIA_DTYPE_BASE.descr}")
 
-    dynamodb = boto3.resource('dynamodb')
+    dynamodb = get_dynamodb_resource()
     minutiae_table = dynamodb.Table(os.environ['INPUT_TABLE_NAME'])
     results_table = dynamodb.Table(os.environ['RESULT_TABLE_NAME'])
 
-    logger.info(f"Connected to tables: {os.environ['INPUT_TABLE_NAME']}, {os.environ['RESULT_TABLE_NAME']}")
+    # Сначала собираем все валидные probe из пакета записей.
+    # Записи с некорректными данными не повторяются: повтор дал бы ту же ошибку
+    probes = []
+    for record_idx, record in enumerate(event['Records']):
+        if record['eventName'] != 'INSERT':
+            logger.debug(f"Skipping record {record_idx + 1}: eventName = {record['eventName']}")
+            continue
 
-    try:
-        for record_idx, record in enumerate(event['Records']):
-            logger.info(f"Processing record {record_idx + 1}/{len(event['Records'])}")
-            if record['eventName'] != 'INSERT':
-                logger.info(f"Skipping record {record_idx + 1}: eventName = {record['eventName']}")
-                continue
-                
-            new_image = record['dynamodb']['NewImage']
-            probe_image_id = new_image['ImageId']['S']
+        try:
+            probes.append(parse_probe_record(record))
+        except Exception as e:
+            logger.error(f"Failed to process probe record {record_idx + 1}: {str(e)}")
+            metrics.count('probe_decode_errors')
+            continue  # Пропускаем этот probe и переходим к следующему
 
-            logger.info(f"Processing probe image: {probe_image_id}")
+    summary['probes'] = len(probes)
+    if not probes:
+        log_invocation_summary(summary, metrics)
+        return batch_item_failures([])
+    logger.debug(f"Collected {len(probes)} probes: {[probe.image_id for probe in probes]}")
 
-            # Безопасное декодирование данных probe
-            try:
-                probe_binary_b64 = new_image['MinutiaeBinary']['B']
-                probe_binary = safe_decode_base64(probe_binary_b64, f"Probe {probe_image_id}")
-                probe_minutiae = validate_binary_data(probe_binary, MINUTIA_DTYPE_BASE, f"Probe {probe_image_id}")
-            except Exception as e:
-                logger.error(f"Failed to process probe binary data for {probe_image_id}: {str(e)}")
-                continue  # Пропускаем этот probe и переходим к следующему
+    # ImageId probe, которые нужно повторить (ошибка загрузки группы, сравнения или записи)
+    failed_image_ids = set()
+    try:
+        from candidate_prefilter import build_prefilter_cascade
+        from score_cache import get_score_cache
+        from template_cache import get_template_cache
 
-            # Обработка метаданных
-            try:
-                metadata = new_image['Metadata']['M']
-                probe_center = (int(metadata['center_x']['N']), int(metadata['center_y']['N']))
-                logger.info(f"Probe center coordinates: {probe_center}")
-            except Exception as e:
-                logger.error(f"Failed to parse metadata for {probe_image_id}: {str(e)}")
-                continue
+        template_cache = get_template_cache()
+        prefilter = build_prefilter_cascade()
+        # Счётчики кэша оценок накапливаются за жизнь контейнера - в сводку идёт прирост за вызов
+        score_cache_before = get_score_cache().stats()
+        group_ids = list_group_ids(dynamodb, minutiae_table)
+        summary['groups'] = len(group_ids)
 
-            # Assign IDs to probe
-            try:
-                probe_minutiae, current_id = assign_unique_ids(probe_minutiae, 0)
-                logger.info(f"Assigned IDs to probe minutiae. Next ID: {current_id}")
-            except Exception as e:
-                logger.error(f"Failed to assign IDs to probe minutiae: {str(e)}")
-                continue
+        # Галереи каждой группы загружаются один раз для всех probe пакета,
+        # следующие группы загружаются в фоне, пока сравнивается текущая
+        results = []
+        probe_image_ids = frozenset(probe.image_id for probe in probes)
+        load_group = partial(load_group_templates_threaded, minutiae_table.name, template_cache=template_cache,
+                             skip_image_ids=probe_image_ids)
+        prefetch_depth = int(os.environ.get('GALLERY_PREFETCH_DEPTH', '2'))
+        with GalleryPrefetcher(load_group, group_ids, get_loader_pool(), prefetch_depth) as prefetcher:
+            for group_id, galleries, load_error in prefetcher:
+                if load_error is not None:
+                    # Без этой группы ни один probe не завершён - повторяем все
+                    logger.error(f"Failed to process group {group_id}: {str(load_error)}")
+                    failed_image_ids.update(probe_image_ids)
+                    continue
+                logger.debug(f"Processing group {group_id} with {len(galleries)} galleries for {len(probes)} probes")
 
-            # Initialize global caches (by ImageId)
-            global_dist_cache = {}
-            global_angle_cache = {}
-            logger.info("Initialized global caches")
-            logger.info("Starting scan for unique group IDs")
+                for probe in probes:
+                    try:
+                        result, successful, pruned, saved = score_group(probe.template, galleries, prefilter)
+                        results.append({'ImageId': probe.image_id, 'GroupId': group_id, 'Result': result})
+                        logger.debug(f"Group {group_id}, probe {probe.image_id}: {successful} successful comparisons "
+                                     f"({pruned} pruned, {saved} skipped by early exit), result = {result}")
+                    except Exception as e:
+                        logger.error(f"Failed to process group {group_id} for probe {probe.image_id}: {str(e)}")
+                        failed_image_ids.add(probe.image_id)
 
-            # Scan unique group IDs (optimize with GSI if available)
-            try:
-                scan_response = minutiae_table.scan(ProjectionExpression='GroupId')
-                group_ids = set(item['GroupId'] for item in scan_response['Items'] if 'GroupId' in item)
-                while 'LastEvaluatedKey' in scan_response:
-                    scan_response = minutiae_table.scan(ProjectionExpression='GroupId',
-                                                        ExclusiveStartKey=scan_response['LastEvaluatedKey'])
-                    group_ids.update(item['GroupId'] for item in scan_response['Items'] if 'GroupId' in item)
-
-                logger.info(f"Found {len(group_ids)} unique groups")
-            except Exception as e:
-                logger.error(f"Failed to scan for group IDs: {str(e)}")
-                continue
+        summary['prefilter'] = prefilter.stats()
+        summary['score_cache'] = {name: value - score_cache_before[name]
+                                  for name, value in get_score_cache().stats().items()}
 
-            for group_id in group_ids:
-                try:
-                    # Query galleries in group
-                    query_response = minutiae_table.query(KeyConditionExpression=Key('GroupId').eq(group_id))
-                    galleries = query_response['Items']
-                    while 'LastEvaluatedKey' in query_response:
-                        query_response = minutiae_table.query(KeyConditionExpression=Key('GroupId').eq(group_id),
-                                                              ExclusiveStartKey=query_response['LastEvaluatedKey'])
-                        galleries.extend(query_response['Items'])
-
-                    logger.info(f"Processing group {group_id} with {len(galleries)} galleries")
-                    
-                    group_scores = []
-                    group_size = 0
-                    
-                    for gallery in galleries:
-                        if gallery['ImageId'] == probe_image_id:
-                            continue
-                            
-                        group_size += 1
-                        gallery_image_id = gallery['ImageId']
-                        
-                        try:
-                            # Безопасное декодирование данных gallery
-                            gallery_binary_b64 = gallery['MinutiaeBinary']['B']
-                            gallery_binary = safe_decode_base64(gallery_binary_b64, f"Gallery {gallery_image_id}")
-                            gallery_minutiae = validate_binary_data(gallery_binary, MINUTIA_DTYPE_BASE, f"Gallery {gallery_image_id}")
-                            
-                            gallery_metadata = gallery['Metadata']['M']
-                            gallery_center = (int(gallery_metadata['center_x']['N']), int(gallery_metadata['center_y']['N']))
-                            gallery_minutiae, current_id = assign_unique_ids(gallery_minutiae, current_id)
-                            
-                            score, global_dist_cache, global_angle_cache = compare_images(
-                                probe_minutiae=probe_minutiae,
-                                probe_center=probe_center,
-                                probe_image_id=probe_image_id,
-                                gallery_minutiae=gallery_minutiae,
-                                gallery_center=gallery_center,
-                                gallery_image_id=gallery_image_id,
-                                global_dist_cache=global_dist_cache,
-                                global_angle_cache=global_angle_cache
-                            )
-                            group_scores.append(score)
-                            
-                        except Exception as e:
-                            logger.error(f"Failed to process gallery {gallery_image_id}: {str(e)}")
-                            continue  # Пропускаем эту gallery и продолжаем
-
-                    # Aggregate scores and evaluate
-                    normalized_pos, normalized_mea = aggregate_group_scores(group_scores, group_size)
-                    result = "YES" if evaluate_thresholds(normalized_pos, normalized_mea) else "NO"
-                    
-                    results_table.put_item(Item={
-                        'ImageId': probe_image_id,
-                        'GroupId': group_id,
-                        'Result': result
-                    })
-                    
-                    logger.info(f"Group {group_id}: {len(group_scores)} successful comparisons, result = {result}")
-                    
-                except Exception as e:
-                    logger.error(f"Failed to process group {group_id}: {str(e)}")
-                    continue  # Пропускаем эту группу и продолжаем
-
-            # Delete probe entry
-            try:
-                minutiae_table.delete_item(Key={'ImageId': probe_image_id})
-                logger.info(f"Deleted probe entry: {probe_image_id}")
-            except Exception as e:
-                logger.error(f"Failed to delete probe entry {probe_image_id}: {str(e)}")
+        # Результаты всех probe записываются вместе после сравнения.
+        # Частичные результаты повторяемых probe тоже пишутся: put_item при повторе их перезапишет
+        with metrics.timed('write'):
+            write_results(results_table, results)
+        summary['results'] = len(results)
+        summary['yes_results'] = sum(1 for item in results if item['Result'] == "YES")
 
     except Exception as e:
         error_details = {
             'error': str(e),
             'type': type(e).__name__,
             'traceback': traceback.format_exc(),
-            'probe_image_id': probe_image_id if 'probe_image_id' in locals() else 'unknown',
             'request_id': context.aws_request_id
         }
         logger.error(f"Critical error in lambda handler: {json.dumps(error_details, indent=2)}")
-        return {'statusCode': 500, 'body': json.dumps(error_details)}
+        summary['failed_probes'] = len(probes)
+        log_invocation_summary(summary, metrics)
+        return batch_item_failures(probe.item_identifier for probe in probes)
+
+    # Delete completed probe entries; failed ones stay until the retry completes them
+    with metrics.timed('write'):
+        for probe in probes:
+            if probe.image_id in failed_image_ids:
+                continue
+            try:
+                minutiae_table.delete_item(Key={'ImageId': probe.image_id})
+                logger.debug(f"Deleted probe entry: {probe.image_id}")
+            except Exception as e:
+                logger.error(f"Failed to delete probe entry {probe.image_id}: {str(e)}")
 
-    return {'statusCode': 200}
+    failed = [probe.item_identifier for probe in probes if probe.image_id in failed_image_ids]
+    if failed:
+        logger.warning(f"Reporting {len(failed)} of {len(probes)} probe records as failed: {sorted(failed_image_ids)}")
+    summary['failed_probes'] = len(failed)
+    log_invocation_summary(summary, metrics)
+    return batch_item_failures(failed)
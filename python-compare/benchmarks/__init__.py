@@ -0,0 +1 @@
+"""Comparator benchmarks: synthetic templates and throughput runs (python -m benchmarks.run)."""
@@ -0,0 +1,217 @@
+"""
+Comparator throughput benchmarks.
+
+Usage (from python-compare):
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --counts 40 80 --gallery-sizes 50 --baseline bench.json
+
+Each case reports ops/sec and per-op timings; peak Python-heap memory (tracemalloc, which also sees
+NumPy buffers but not Numba-internal allocations) is measured in a separate untimed round. The score
+cache is disabled so every op runs the full matcher. With --baseline, cases slower than the baseline
+by more than --tolerance are flagged and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Benchmarks measure the matcher itself, never cached scores
+os.environ['SCORE_CACHE_MAX_ENTRIES'] = '0'
+os.environ.pop('SCORE_CACHE_URL', None)
+
+import numba  # noqa: E402
+import numpy as np  # noqa: E402
+
+import minutia_comparison as mc  # noqa: E402
+from benchmarks.synthetic import generate_template, make_gallery, make_pair  # noqa: E402
+from comparison_executor import get_executor  # noqa: E402
+from score_cache import ScoreCache  # noqa: E402
+
+DEFAULT_COUNTS = (30, 60, 100)
+DEFAULT_GALLERY_SIZES = (10, 100)
+# Distinct synthetic pairs each case cycles through
+PAIRS_PER_CASE = 8
+
+
+def measure(fn, inputs: list, min_time: float, min_rounds: int) -> dict:
+    """
+    Times fn over inputs until both min_time seconds and min_rounds rounds have passed.
+
+    Returns:
+        Dict with ops_per_sec, mean/median/min ms per op, ops and peak_memory_kb.
+    """
+    for args in inputs:
+        fn(*args)  # warm-up: compilation, caches, thread pools
+
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < min_rounds * len(inputs) or time.perf_counter() - started < min_time:
+        for args in inputs:
+            op_started = time.perf_counter()
+            fn(*args)
+            durations.append(time.perf_counter() - op_started)
+    elapsed = sum(durations)
+
+    tracemalloc.start()
+    for args in inputs:
+        fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations_ms = np.array(durations) * 1000
+    return {
+        'ops': len(durations),
+        'ops_per_sec': round(len(durations) / elapsed, 2),
+        'mean_ms': round(float(durations_ms.mean()), 4),
+        'median_ms': round(float(np.median(durations_ms)), 4),
+        'min_ms': round(float(durations_ms.min()), 4),
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+
+
+def pair_cases(counts: list, rng: np.random.Generator) -> list:
+    """compare_images, local stage and global stage cases for mated and non-mated pairs."""
+    cases = []
+    for count in counts:
+        for mated in (True, False):
+            pairs = [make_pair(count, mated, rng) for _ in range(PAIRS_PER_CASE)]
+            params = {'minutiae': count, 'mated': mated}
+
+            # Fresh metric caches on every call, as for a pair of images never seen before
+            images = [(pair.probe, pair.probe_center, 'probe', pair.gallery, pair.gallery_center, 'gallery')
+                      for pair in pairs]
+            cases.append(('compare_images', params, lambda *image_args: mc.compare_images(*image_args, {}, {}),
+                          images))
+
+            templates = [(mc.build_template(pair.probe, pair.probe_center),
+                          mc.build_template(pair.gallery, pair.gallery_center)) for pair in pairs]
+            local_inputs = [(probe.group, gallery.group, (probe.dist_matrix, probe.angle_matrix),
+                             (gallery.dist_matrix, gallery.angle_matrix)) for probe, gallery in templates]
+            cases.append(('local_stage', params, mc.perform_local_comparisons, local_inputs))
+
+            global_inputs = [(mc.perform_local_comparisons(*local), probe.minutiae, gallery.minutiae, probe.grid_index)
+                             for local, (probe, gallery) in zip(local_inputs, templates)]
+            cases.append(('global_stage', params,
+                          lambda results, probe, gallery, index: mc.perform_global_comparisons(
+                              results, probe, gallery, probe_index=index),
+                          global_inputs))
+    return cases
+
+
+def gallery_cases(counts: list, gallery_sizes: list, rng: np.random.Generator) -> list:
+    """One probe against prebuilt gallery templates (10% mated), as the handler scores a group."""
+    cases = []
+    no_cache = ScoreCache(0)
+
+    def score_gallery(probe_template, gallery_templates):
+        return [mc.compare_templates(probe_template, template, no_cache) for template in gallery_templates]
+
+    for count in counts:
+        for size in gallery_sizes:
+            finger = generate_template(count, rng)
+            probe = mc.build_template(finger, (150, 200))
+            gallery = [mc.build_template(minutiae, center)
+                       for minutiae, center, _ in make_gallery(finger, size, 0.1, rng)]
+            cases.append(('gallery_scan', {'minutiae': count, 'gallery_size': size}, score_gallery,
+                          [(probe, gallery)]))
+    return cases
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    executor = get_executor()
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'numba': numba.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'executor_backend': executor.backend,
+        'executor_workers': executor.max_workers,
+        'global_engine': mc.GLOBAL_ENGINE,
+        'matcher_params_version': mc.MATCHER_PARAMS_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    }
+
+
+def case_key(result: dict) -> str:
+    return result['name'] + json.dumps(result['params'], sort_keys=True)
+
+
+def compare_with_baseline(results: list, baseline_path: str, tolerance: float) -> list:
+    """
+    Prints ops/sec against a previous run and returns the keys of cases slower than tolerance allows.
+    """
+    with open(baseline_path) as f:
+        baseline = {case_key(result): result for result in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        previous = baseline.get(case_key(result))
+        if previous is None:
+            continue
+        ratio = result['ops_per_sec'] / previous['ops_per_sec']
+        flag = ''
+        if ratio < 1 - tolerance:
+            flag = '  REGRESSION'
+            regressions.append(case_key(result))
+        print(f"{result['name']:<15} {json.dumps(result['params']):<45} {previous['ops_per_sec']:>10.1f} -> "
+              f"{result['ops_per_sec']:>10.1f} ops/s ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counts', type=int, nargs='+', default=list(DEFAULT_COUNTS),
+                        help='Minutiae per template')
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=list(DEFAULT_GALLERY_SIZES),
+                        help='Galleries per probe in the gallery_scan cases')
+    parser.add_argument('--filter', default='', help='Run only cases whose name contains this string')
+    parser.add_argument('--min-time', type=float, default=1.0, help='Minimum timed seconds per case')
+    parser.add_argument('--min-rounds', type=int, default=3, help='Minimum rounds over the case inputs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Previous JSON output to compare ops/sec against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative ops/sec drop against the baseline reported as a regression')
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    cases = pair_cases(args.counts, rng) + gallery_cases(args.counts, args.gallery_sizes, rng)
+    results = []
+    for name, params, fn, inputs in cases:
+        if args.filter not in name:
+            continue
+        result = dict(name=name, params=params, **measure(fn, inputs, args.min_time, args.min_rounds))
+        results.append(result)
+        print(f"{name:<15} {json.dumps(params):<45} {result['ops_per_sec']:>10.1f} ops/s "
+              f"{result['median_ms']:>9.3f} ms median {result['peak_memory_kb']:>9.1f} KB peak")
+
+    report = {
+        'environment': environment(),
+        'results': results,
+        # Whole-process peak RSS, including Numba allocations and compiled code
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        if compare_with_baseline(results, args.baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Synthetic minutiae templates for comparator benchmarks.
+
+Templates imitate extractor output: minutiae spread over an elliptical finger area, directions
+following a smooth ridge-orientation field (bifurcations point the opposite way), and mated
+impressions derived by rotating, translating and jittering the same finger with some minutiae
+lost and some spurious ones added.
+"""
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from minutia_types import MINUTIA_DTYPE
+
+# Finger area of a typical crop, pixels
+FINGER_WIDTH = 300
+FINGER_HEIGHT = 400
+
+
+class SyntheticPair(NamedTuple):
+    probe: np.ndarray
+    probe_center: tuple
+    gallery: np.ndarray
+    gallery_center: tuple
+    mated: bool
+
+
+def template_center(minutiae: np.ndarray) -> tuple:
+    """Integer centroid of the minutiae, as stored in the item Metadata."""
+    if len(minutiae) == 0:
+        return FINGER_WIDTH // 2, FINGER_HEIGHT // 2
+    return int(round(float(minutiae['x'].mean()))), int(round(float(minutiae['y'].mean())))
+
+
+def _orientation_field(x: np.ndarray, y: np.ndarray, core: tuple) -> np.ndarray:
+    """Loop-like ridge orientation around a core point, in radians."""
+    angle = 0.5 * np.arctan2(y - core[1], x - core[0])
+    return angle + 0.15 * np.sin(x / 40.0) + 0.1 * np.cos(y / 55.0)
+
+
+def generate_template(count: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Generates one finger's minutiae.
+
+    Args:
+        count: Number of minutiae.
+        rng: Random generator.
+
+    Returns:
+        Array with MINUTIA_DTYPE, IDs assigned from 0.
+    """
+    minutiae = np.zeros(count, dtype=MINUTIA_DTYPE)
+    # Uniform points inside the finger ellipse
+    radius = np.sqrt(rng.uniform(0, 1, count))
+    phi = rng.uniform(0, 2 * math.pi, count)
+    minutiae['x'] = FINGER_WIDTH / 2 + radius * np.cos(phi) * FINGER_WIDTH * 0.45
+    minutiae['y'] = FINGER_HEIGHT / 2 + radius * np.sin(phi) * FINGER_HEIGHT * 0.45
+    core = (FINGER_WIDTH / 2 + rng.normal(0, 15), FINGER_HEIGHT * 0.45 + rng.normal(0, 20))
+    minutiae['type'] = (rng.uniform(0, 1, count) < 0.6).astype(np.int32)
+    theta = _orientation_field(minutiae['x'], minutiae['y'], core)
+    # A ridge ending and a bifurcation on the same ridge flow point in opposite directions
+    theta = np.where(minutiae['type'] == 1, theta, theta + math.pi) + rng.normal(0, 0.05, count)
+    minutiae['theta'] = np.mod(theta + math.pi, 2 * math.pi) - math.pi
+    minutiae['quality'] = rng.uniform(0.4, 1.0, count)
+    minutiae['id'] = np.arange(count)
+    return minutiae
+
+
+def distort(minutiae: np.ndarray, rng: np.random.Generator, noise: float = 2.0, translation: float = 20.0,
+            rotation: float = 10.0, drop: float = 0.15, spurious: float = 0.1) -> np.ndarray:
+    """
+    Produces another impression of the same finger.
+
+    Args:
+        minutiae: Source impression (MINUTIA_DTYPE).
+        rng: Random generator.
+        noise: Position jitter standard deviation, pixels (direction jitter is noise × 0.02 rad).
+        translation: Maximum translation per axis, pixels.
+        rotation: Maximum rotation around the center, degrees.
+        drop: Share of minutiae lost.
+        spurious: Share of spurious minutiae added (relative to the source count).
+
+    Returns:
+        Array with MINUTIA_DTYPE, IDs reassigned from 0.
+    """
+    kept = minutiae[rng.uniform(0, 1, len(minutiae)) >= drop].copy()
+    center_x, center_y = template_center(minutiae)
+    angle = math.radians(rng.uniform(-rotation, rotation))
+    shift_x, shift_y = rng.uniform(-translation, translation, 2)
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+    dx = kept['x'] - center_x
+    dy = kept['y'] - center_y
+    kept['x'] = center_x + dx * cos_a - dy * sin_a + shift_x + rng.normal(0, noise, len(kept))
+    kept['y'] = center_y + dx * sin_a + dy * cos_a + shift_y + rng.normal(0, noise, len(kept))
+    theta = kept['theta'] + angle + rng.normal(0, noise * 0.02, len(kept))
+    kept['theta'] = np.mod(theta + math.pi, 2 * math.pi) - math.pi
+
+    extra = generate_template(int(round(len(minutiae) * spurious)), rng)
+    extra['x'] += shift_x
+    extra['y'] += shift_y
+    impression = np.concatenate([kept, extra])
+    impression = impression[rng.permutation(len(impression))]
+    impression['id'] = np.arange(len(impression))
+    return impression
+
+
+def make_pair(count: int, mated: bool, rng: np.random.Generator, **distortion) -> SyntheticPair:
+    """
+    Generates a probe and a gallery impression: of the same finger if mated, of another finger otherwise.
+
+    Args:
+        count: Minutiae per finger.
+        mated: Whether both impressions come from the same finger.
+        rng: Random generator.
+        **distortion: distort() parameters for the gallery impression.
+    """
+    finger = generate_template(count, rng)
+    probe = distort(finger, rng, **distortion)
+    gallery = distort(finger if mated else generate_template(count, rng), rng, **distortion)
+    return SyntheticPair(probe, template_center(probe), gallery, template_center(gallery), mated)
+
+
+def make_gallery(probe_finger: np.ndarray, size: int, mated_share: float, rng: np.random.Generator,
+                 **distortion) -> list:
+    """
+    Generates gallery impressions for one probe finger.
+
+    Args:
+        probe_finger: Finger the mated impressions are derived from.
+        size: Number of gallery impressions.
+        mated_share: Share of impressions of the probe finger; the rest are other fingers.
+        rng: Random generator.
+        **distortion: distort() parameters.
+
+    Returns:
+        List of (minutiae, center, mated).
+    """
+    gallery = []
+    for index in range(size):
+        mated = index < round(size * mated_share)
+        finger = probe_finger if mated else generate_template(len(probe_finger), rng)
+        impression = distort(finger, rng, **distortion)
+        gallery.append((impression, template_center(impression), mated))
+    return gallery
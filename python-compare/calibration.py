@@ -0,0 +1,413 @@
+"""
+All-pairs scoring and FAR/FRR threshold calibration over an FVC-style dataset.
+
+Usage (from python-compare):
+    python calibration.py score --inputs ../OTHER_MATERIALS/Fingerprint/upload --run runs/fvc --workers 8
+    python calibration.py sweep --run runs/fvc --output runs/fvc/sweep.json --curves runs/fvc/det.csv
+
+--inputs takes the raw <group>_<n>.<ext> impressions of a directory (80 in the sample upload folder);
+the _cropped, _enhanced, _skeleton and _plots derivatives saved next to them are skipped, as they
+would pass for extra genuine impressions of the same finger.
+
+score extracts or reads every input once (see offline_identify), then compares every ordered pair
+of templates with compare_templates and stores the raw scores in RUN/scores.npy, an N×N float32
+array on disk (NaN on the diagonal and for failed comparisons). The matrix is split into square
+shards spread over a process pool; each finished shard leaves a marker in RUN/shards, so an
+interrupted run started again with the same --run only scores the missing shards.
+
+sweep never rescores: it rebuilds the comparator's group decision from the stored matrix for every
+(probe, group) pair, leaving the probe's own image out of its group as the Lambda does, and
+evaluates FAR/FRR for a whole grid of POS/MEA thresholds at once. Scores are raw matcher scores:
+the candidate prefilter, which can only turn a gallery's score into 0, is not applied.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import NormalDist
+
+# Пары уникальны, кэш оценок в памяти бесполезен
+os.environ.setdefault('COMPARATOR_BACKEND', 'serial')
+os.environ.setdefault('NUMBA_NUM_THREADS', '1')
+os.environ.setdefault('COMPARATOR_WARMUP', '0')
+os.environ.setdefault('SCORE_CACHE_MAX_ENTRIES', '0')
+# Родитель импортирует Numba до fork воркеров; с TBB такой процесс зависает на выходе
+os.environ.setdefault('NUMBA_THREADING_LAYER', 'workqueue')
+
+import numpy as np  # noqa: E402
+
+from offline_identify import DEFAULT_EXTRACTOR_PATH, group_id_from_filename, list_inputs, load_all  # noqa: E402
+from score_aggregation import ADAPTIVE_MEA_LOW, ADAPTIVE_POS_HIGH, MEA_THRESHOLD, POS_THRESHOLD  # noqa: E402
+
+INDEX_FILE = 'index.json'
+SCORES_FILE = 'scores.npy'
+TEMPLATES_FILE = 'templates.npz'
+SHARDS_DIR = 'shards'
+
+
+def shard_marker(run_dir: str, row: int, column: int) -> str:
+    return os.path.join(run_dir, SHARDS_DIR, f"{row}_{column}.done")
+
+
+def prepare_run(run_dir: str, inputs: list, workers: int, extractor_path: str, shard_size: int) -> dict:
+    """
+    Creates the run directory (index, templates, NaN score matrix) or reopens an existing one.
+
+    Returns:
+        The run index: image_ids, group_ids, centers, shard_size, matcher_params_version
+    """
+    from minutia_comparison import MATCHER_PARAMS_VERSION
+
+    index_path = os.path.join(run_dir, INDEX_FILE)
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index['matcher_params_version'] != MATCHER_PARAMS_VERSION:
+            raise ValueError(f"Run {run_dir} was scored with matcher params {index['matcher_params_version']}, "
+                             f"current are {MATCHER_PARAMS_VERSION}; use a new --run directory")
+        print(f"Resuming {run_dir}: {len(index['image_ids'])} templates", file=sys.stderr)
+        return index
+
+    paths = list_inputs(inputs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        loaded, errors, extract_ms = load_all(paths, pool, extractor_path)
+    for image_id, error in errors.items():
+        print(f"Skipping {image_id}: {error}", file=sys.stderr)
+    image_ids = sorted(loaded)
+    print(f"Loaded {len(image_ids)} templates in {extract_ms / 1000:.1f} s of worker time", file=sys.stderr)
+
+    os.makedirs(os.path.join(run_dir, SHARDS_DIR), exist_ok=True)
+    np.savez(os.path.join(run_dir, TEMPLATES_FILE), *[loaded[image_id][0] for image_id in image_ids])
+    scores = np.lib.format.open_memmap(os.path.join(run_dir, SCORES_FILE), mode='w+', dtype=np.float32,
+                                       shape=(len(image_ids), len(image_ids)))
+    scores[:] = np.nan
+    scores.flush()
+    del scores
+
+    index = {
+        'image_ids': image_ids,
+        'group_ids': [group_id_from_filename(image_id) for image_id in image_ids],
+        'centers': [list(loaded[image_id][1]) for image_id in image_ids],
+        'shard_size': shard_size,
+        'matcher_params_version': MATCHER_PARAMS_VERSION
+    }
+    # Индекс пишется последним: его наличие означает, что каталог запуска готов
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(index_path + '.tmp', index_path)
+    return index
+
+
+# Состояние воркера: шаблоны запуска и матрица оценок на диске
+_worker_records = []
+_worker_centers = []
+_worker_templates = {}
+_worker_scores = None
+
+
+def _init_worker(run_dir: str, centers: list) -> None:
+    global _worker_records, _worker_centers, _worker_scores
+    with np.load(os.path.join(run_dir, TEMPLATES_FILE)) as data:
+        _worker_records = [data[f"arr_{position}"] for position in range(len(centers))]
+    _worker_centers = [tuple(center) for center in centers]
+    _worker_scores = np.lib.format.open_memmap(os.path.join(run_dir, SCORES_FILE), mode='r+')
+
+
+def _template(position: int):
+    from minutia_comparison import build_template
+    from minutia_types import assign_unique_ids
+
+    template = _worker_templates.get(position)
+    if template is None:
+        minutiae, _ = assign_unique_ids(_worker_records[position], 0)
+        template = _worker_templates[position] = build_template(minutiae, _worker_centers[position])
+    return template
+
+
+def score_shard(row: int, column: int, size: int) -> tuple:
+    """
+    Scores one shard of the matrix (runs in a worker process) and flushes it to disk.
+
+    Args:
+        row: First probe index of the shard
+        column: First gallery index of the shard
+        size: Shard side
+
+    Returns:
+        Tuple (row, column, comparisons, failures)
+    """
+    from minutia_comparison import compare_templates
+
+    total = len(_worker_records)
+    tile = np.full((min(size, total - row), min(size, total - column)), np.nan, dtype=np.float32)
+    comparisons = failures = 0
+    for i in range(tile.shape[0]):
+        for j in range(tile.shape[1]):
+            if row + i == column + j:
+                continue
+            try:
+                tile[i, j] = compare_templates(_template(row + i), _template(column + j))
+                comparisons += 1
+            except Exception:
+                failures += 1
+    _worker_scores[row:row + tile.shape[0], column:column + tile.shape[1]] = tile
+    _worker_scores.flush()
+    return row, column, comparisons, failures
+
+
+def run_scoring(args) -> int:
+    index = prepare_run(args.run, args.inputs, args.workers, args.extractor_path, args.shard_size)
+    total = len(index['image_ids'])
+    size = index['shard_size']
+    shards = [(row, column) for row in range(0, total, size) for column in range(0, total, size)
+              if not os.path.exists(shard_marker(args.run, row, column))]
+    print(f"{len(shards)} of {(-(-total // size)) ** 2} shards to score", file=sys.stderr)
+
+    started = time.perf_counter()
+    comparisons = failures = done = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.run, index['centers'])) as pool:
+        futures = [pool.submit(score_shard, row, column, size) for row, column in shards]
+        for future in as_completed(futures):
+            row, column, shard_comparisons, shard_failures = future.result()
+            # Маркер ставится только после того, как воркер сбросил шард на диск
+            open(shard_marker(args.run, row, column), 'w').close()
+            comparisons += shard_comparisons
+            failures += shard_failures
+            done += 1
+            elapsed = time.perf_counter() - started
+            print(f"Shard {done}/{len(shards)}: {comparisons} comparisons, "
+                  f"{comparisons / elapsed:.1f}/s", file=sys.stderr)
+    if failures:
+        print(f"{failures} comparisons failed and are stored as NaN", file=sys.stderr)
+    return 0
+
+
+def group_scores(scores: np.ndarray, group_ids: list) -> tuple:
+    """
+    Rebuilds normalized_pos/normalized_mea of every (probe, group) pair from the score matrix.
+
+    Matches IncrementalGroupAggregator.result(): pos is the best valid score, mea the sum of valid
+    scores divided by the group size, where the probe's own image does not belong to the group.
+
+    Returns:
+        Tuple (pos, mea, group_size, groups) with (N, G) arrays and the G group IDs
+    """
+    groups = sorted(set(group_ids))
+    membership = np.zeros((len(group_ids), len(groups)), dtype=bool)
+    membership[np.arange(len(group_ids)), [groups.index(group_id) for group_id in group_ids]] = True
+
+    valid = ~np.isnan(scores)
+    np.fill_diagonal(valid, False)
+    filled = np.where(valid, scores, 0.0).astype(np.float64)
+    mea_sum = filled @ membership
+    valid_count = valid.astype(np.int32) @ membership
+    group_size = membership.sum(axis=0)[np.newaxis, :] - membership.astype(np.int64)
+    pos = np.stack([np.where(valid[:, members], filled[:, members], -np.inf).max(axis=1, initial=-np.inf)
+                    for members in membership.T], axis=1)
+
+    pos = np.where(valid_count > 0, pos, 0.0)
+    mea = np.where((valid_count > 0) & (group_size > 0), mea_sum / np.maximum(group_size, 1), 0.0)
+    return pos, mea, group_size, groups
+
+
+def acceptance_counts(pos: np.ndarray, mea: np.ndarray, pos_grid: np.ndarray, mea_grid: np.ndarray) -> np.ndarray:
+    """
+    Counts pairs with pos >= pos_grid[a] and mea >= mea_grid[b] for the whole grid at once.
+
+    Each pair is binned at the largest grid values it reaches; reverse cumulative sums of the 2D
+    histogram then give the count for every threshold pair.
+    """
+    pos_bin = np.searchsorted(pos_grid, pos, side='right') - 1
+    mea_bin = np.searchsorted(mea_grid, mea, side='right') - 1
+    reached = (pos_bin >= 0) & (mea_bin >= 0)
+    histogram = np.bincount(pos_bin[reached] * len(mea_grid) + mea_bin[reached],
+                            minlength=len(pos_grid) * len(mea_grid)).reshape(len(pos_grid), len(mea_grid))
+    return histogram[::-1, ::-1].cumsum(axis=0).cumsum(axis=1)[::-1, ::-1]
+
+
+def decision_rates(pos: np.ndarray, mea: np.ndarray, pos_grid: np.ndarray, mea_grid: np.ndarray,
+                   adaptive: tuple = None) -> np.ndarray:
+    """
+    Share of pairs evaluate_thresholds accepts for every (POS_THRESHOLD, MEA_THRESHOLD) on the grid.
+
+    Args:
+        adaptive: Fixed (ADAPTIVE_POS_HIGH, ADAPTIVE_MEA_LOW) OR-ed with the basic rule, or None
+
+    Returns:
+        (len(pos_grid), len(mea_grid)) array of accept rates
+    """
+    if len(pos) == 0:
+        return np.zeros((len(pos_grid), len(mea_grid)))
+    if adaptive is None:
+        return acceptance_counts(pos, mea, pos_grid, mea_grid) / len(pos)
+
+    # Адаптивные пороги добавляются в сетку, чтобы пересечение правил читалось из той же таблицы
+    full_pos = np.union1d(pos_grid, [adaptive[0]])
+    full_mea = np.union1d(mea_grid, [adaptive[1]])
+    counts = acceptance_counts(pos, mea, full_pos, full_mea)
+    pos_index = np.searchsorted(full_pos, pos_grid)
+    mea_index = np.searchsorted(full_mea, mea_grid)
+    basic = counts[np.ix_(pos_index, mea_index)]
+    adaptive_only = counts[np.searchsorted(full_pos, adaptive[0]), np.searchsorted(full_mea, adaptive[1])]
+    both = counts[np.ix_(np.searchsorted(full_pos, np.maximum(pos_grid, adaptive[0])),
+                         np.searchsorted(full_mea, np.maximum(mea_grid, adaptive[1])))]
+    return (basic + adaptive_only - both) / len(pos)
+
+
+def score_roc(genuine: np.ndarray, impostor: np.ndarray) -> tuple:
+    """
+    Pair-level ROC of raw scores: FAR and FRR at every distinct score used as the acceptance threshold.
+
+    Returns:
+        Tuple (thresholds, far, frr), thresholds descending
+    """
+    thresholds = np.unique(np.concatenate([genuine, impostor]))[::-1]
+    genuine_sorted = np.sort(genuine)
+    impostor_sorted = np.sort(impostor)
+    far = (len(impostor_sorted) - np.searchsorted(impostor_sorted, thresholds, side='left')) / max(len(impostor), 1)
+    frr = np.searchsorted(genuine_sorted, thresholds, side='left') / max(len(genuine), 1)
+    return thresholds, far, frr
+
+
+def equal_error_rate(far: np.ndarray, frr: np.ndarray) -> tuple:
+    """Position and value of the point where FAR and FRR are closest."""
+    position = int(np.argmin(np.abs(far - frr)))
+    return position, float((far[position] + frr[position]) / 2)
+
+
+def pareto_front(far: np.ndarray, frr: np.ndarray) -> np.ndarray:
+    """Flat indices of grid points not dominated in both FAR and FRR, ordered by FAR."""
+    order = np.lexsort((frr.ravel(), far.ravel()))
+    frr_sorted = frr.ravel()[order]
+    best_before = np.minimum.accumulate(np.concatenate([[np.inf], frr_sorted[:-1]]))
+    return order[frr_sorted < best_before]
+
+
+def probit(rates: np.ndarray) -> list:
+    """DET axis coordinates; 0 and 1 are clipped to keep them finite."""
+    normal = NormalDist()
+    return [normal.inv_cdf(min(max(float(rate), 1e-6), 1 - 1e-6)) for rate in rates]
+
+
+def parse_grid(spec: str) -> np.ndarray:
+    start, stop, step = (float(value) for value in spec.split(':'))
+    return np.round(np.arange(start, stop + step / 2, step), 6)
+
+
+def run_sweep(args) -> int:
+    with open(os.path.join(args.run, INDEX_FILE)) as f:
+        index = json.load(f)
+    scores = np.load(os.path.join(args.run, SCORES_FILE), mmap_mode='r')
+    total = len(index['image_ids'])
+    size = index['shard_size']
+    missing = [(row, column) for row in range(0, total, size) for column in range(0, total, size)
+               if not os.path.exists(shard_marker(args.run, row, column))]
+    if missing:
+        print(f"Warning: {len(missing)} shards are not scored yet and count as failed comparisons", file=sys.stderr)
+
+    scores = np.asarray(scores, dtype=np.float32)
+    pos, mea, group_size, groups = group_scores(scores, index['group_ids'])
+    own_group = np.array(index['group_ids'])[:, np.newaxis] == np.array(groups)[np.newaxis, :]
+    # Пары без gallery (группа из одного probe) в Lambda не оцениваются
+    genuine = own_group & (group_size > 0)
+    impostor = ~own_group & (group_size > 0)
+
+    pos_grid = parse_grid(args.pos_grid)
+    mea_grid = parse_grid(args.mea_grid)
+    adaptive = None if args.no_adaptive else (args.adaptive_pos, args.adaptive_mea)
+    far = decision_rates(pos[impostor], mea[impostor], pos_grid, mea_grid, adaptive)
+    frr = 1.0 - decision_rates(pos[genuine], mea[genuine], pos_grid, mea_grid, adaptive)
+
+    def operating_point(a: int, b: int) -> dict:
+        return {'pos_threshold': float(pos_grid[a]), 'mea_threshold': float(mea_grid[b]),
+                'far': float(far[a, b]), 'frr': float(frr[a, b])}
+
+    eer_position, eer = equal_error_rate(far.ravel(), frr.ravel())
+    report = {
+        'run': args.run,
+        'matcher_params_version': index['matcher_params_version'],
+        'templates': total,
+        'groups': len(groups),
+        'genuine_decisions': int(genuine.sum()),
+        'impostor_decisions': int(impostor.sum()),
+        'adaptive': None if adaptive is None else {'pos_high': adaptive[0], 'mea_low': adaptive[1]},
+        'current': {'pos_threshold': POS_THRESHOLD, 'mea_threshold': MEA_THRESHOLD,
+                    'far': float(decision_rates(pos[impostor], mea[impostor], np.array([POS_THRESHOLD]),
+                                                np.array([MEA_THRESHOLD]), adaptive)[0, 0]),
+                    'frr': float(1.0 - decision_rates(pos[genuine], mea[genuine], np.array([POS_THRESHOLD]),
+                                                      np.array([MEA_THRESHOLD]), adaptive)[0, 0])},
+        'eer': dict(operating_point(*np.unravel_index(eer_position, far.shape)), eer=eer),
+        'target_far': []
+    }
+    for target in args.target_far:
+        # Минимальный FRR среди порогов, удерживающих FAR не выше цели
+        allowed = np.where(far <= target, frr, np.inf)
+        a, b = np.unravel_index(int(np.argmin(allowed)), allowed.shape)
+        report['target_far'].append(dict(operating_point(a, b), target=target) if np.isfinite(allowed[a, b])
+                                    else {'target': target, 'reachable': False})
+
+    valid = ~np.isnan(scores)
+    np.fill_diagonal(valid, False)
+    same_finger = np.array(index['group_ids'])[:, np.newaxis] == np.array(index['group_ids'])[np.newaxis, :]
+    thresholds, pair_far, pair_frr = score_roc(scores[valid & same_finger], scores[valid & ~same_finger])
+    if len(thresholds):
+        pair_position, pair_eer = equal_error_rate(pair_far, pair_frr)
+        report['pair_scores'] = {'genuine': int((valid & same_finger).sum()),
+                                 'impostor': int((valid & ~same_finger).sum()),
+                                 'eer': pair_eer, 'eer_threshold': float(thresholds[pair_position])}
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.curves:
+        front = pareto_front(far, frr)
+        with open(args.curves, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['curve', 'pos_threshold', 'mea_threshold', 'far', 'frr', 'far_probit', 'frr_probit'])
+            for position, far_probit, frr_probit in zip(front, probit(far.ravel()[front]), probit(frr.ravel()[front])):
+                a, b = np.unravel_index(position, far.shape)
+                writer.writerow(['group', pos_grid[a], mea_grid[b], far[a, b], frr[a, b], far_probit, frr_probit])
+            for threshold, rate_far, rate_frr, far_probit, frr_probit in zip(
+                    thresholds, pair_far, pair_frr, probit(pair_far), probit(pair_frr)):
+                writer.writerow(['pair', threshold, '', rate_far, rate_frr, far_probit, frr_probit])
+    return 0
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    score = commands.add_parser('score', help='Score all template pairs into RUN/scores.npy')
+    score.add_argument('--inputs', nargs='+', required=True, help='Dataset directories (raw <group>_<n>.<ext> files only) or files')
+    score.add_argument('--run', required=True, help='Run directory; an existing one is resumed')
+    score.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+    score.add_argument('--shard-size', type=int, default=32, help='Side of a square shard of the matrix')
+    score.add_argument('--extractor-path', default=DEFAULT_EXTRACTOR_PATH,
+                       help='python-extract directory, used for image inputs')
+    score.set_defaults(handler=run_scoring)
+
+    sweep = commands.add_parser('sweep', help='FAR/FRR over a threshold grid from a scored run')
+    sweep.add_argument('--run', required=True, help='Scored run directory')
+    sweep.add_argument('--pos-grid', default='0:100:1', help='POS_THRESHOLD grid as start:stop:step')
+    sweep.add_argument('--mea-grid', default='0:100:1', help='MEA_THRESHOLD grid as start:stop:step')
+    sweep.add_argument('--adaptive-pos', type=float, default=ADAPTIVE_POS_HIGH)
+    sweep.add_argument('--adaptive-mea', type=float, default=ADAPTIVE_MEA_LOW)
+    sweep.add_argument('--no-adaptive', action='store_true', help='Sweep the basic rule alone')
+    sweep.add_argument('--target-far', type=float, nargs='*', default=[0.01, 0.001],
+                       help='Report the lowest-FRR thresholds keeping FAR at or below these rates')
+    sweep.add_argument('--output', help='Write the report as JSON to this file')
+    sweep.add_argument('--curves', help='Write ROC/DET points (group decision front and pair scores) as CSV')
+    sweep.set_defaults(handler=run_sweep)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import logging
+import math
+import os
+
+import numpy as np
+
+from minutia_comparison import MinutiaTemplate
+
+logger = logging.getLogger(__name__)
+
+ORIENTATION_BINS = 8
+# Каскад выключен по умолчанию: любой отказ обнуляет оценку галереи, поэтому включать его можно только
+# с порогами, при которых калибровка (calibration.py) не теряет ни одной генуинной пары
+DEFAULT_PREFILTER_SCREENS = ''
+
+
+def orientation_histogram(minutiae: np.ndarray) -> np.ndarray:
+    """Normalized histogram of minutia directions over ORIENTATION_BINS sectors of [0, 2π)."""
+    bins = (np.mod(minutiae['theta'], 2 * math.pi) / (2 * math.pi) * ORIENTATION_BINS).astype(np.int64)
+    histogram = np.bincount(bins % ORIENTATION_BINS, minlength=ORIENTATION_BINS).astype(np.float32)
+    return histogram / max(histogram.sum(), 1.0)
+
+
+def termination_ratio(minutiae: np.ndarray) -> float:
+    """Share of terminations among the minutiae."""
+    if len(minutiae) == 0:
+        return 0.0
+    return float(np.count_nonzero(minutiae['type'] == 1)) / len(minutiae)
+
+
+class PrefilterScreen:
+    """
+    A cheap screen of one probe against many galleries, applied before local matching.
+
+    Subclasses implement keep_mask; the screen counts how many candidates it evaluated and rejected.
+    """
+    name = ''
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.evaluated = 0
+        self.rejected = 0
+
+    def keep_mask(self, probe: MinutiaTemplate, galleries: list) -> np.ndarray:
+        raise NotImplementedError
+
+    def apply(self, probe: MinutiaTemplate, galleries: list) -> np.ndarray:
+        mask = self.keep_mask(probe, galleries)
+        self.evaluated += len(galleries)
+        self.rejected += int(len(galleries) - np.count_nonzero(mask))
+        return mask
+
+
+class CountRatioScreen(PrefilterScreen):
+    """Keeps galleries whose minutia count ratio min(n, m) / max(n, m) is at least the threshold."""
+    name = 'count_ratio'
+
+    def keep_mask(self, probe: MinutiaTemplate, galleries: list) -> np.ndarray:
+        probe_count = len(probe.minutiae)
+        counts = np.array([len(gallery.minutiae) for gallery in galleries], dtype=np.float32)
+        ratios = np.minimum(counts, probe_count) / np.maximum(np.maximum(counts, probe_count), 1)
+        return ratios >= self.threshold
+
+
+class OrientationHistogramScreen(PrefilterScreen):
+    """Keeps galleries whose central-square direction histogram intersects the probe's by at least the threshold."""
+    name = 'orientation_histogram'
+
+    def keep_mask(self, probe: MinutiaTemplate, galleries: list) -> np.ndarray:
+        probe_histogram = orientation_histogram(probe.group)
+        gallery_histograms = np.stack([orientation_histogram(gallery.group) for gallery in galleries])
+        intersections = np.minimum(gallery_histograms, probe_histogram[np.newaxis, :]).sum(axis=1)
+        return intersections >= self.threshold
+
+
+class TypeRatioScreen(PrefilterScreen):
+    """Keeps galleries whose termination ratio differs from the probe's by at most the threshold."""
+    name = 'type_ratio'
+
+    def keep_mask(self, probe: MinutiaTemplate, galleries: list) -> np.ndarray:
+        probe_ratio = termination_ratio(probe.minutiae)
+        ratios = np.array([termination_ratio(gallery.minutiae) for gallery in galleries], dtype=np.float32)
+        return np.abs(ratios - probe_ratio) <= self.threshold
+
+
+SCREEN_TYPES = {screen.name: screen for screen in [CountRatioScreen, OrientationHistogramScreen, TypeRatioScreen]}
+
+
+class PrefilterCascade:
+    """Runs screens in order, each one only on the candidates the previous screens kept."""
+
+    def __init__(self, screens: list):
+        self.screens = screens
+
+    @classmethod
+    def from_spec(cls, spec: str) -> 'PrefilterCascade':
+        """
+        Builds a cascade from a spec like 'count_ratio:0.35,type_ratio:0.5'.
+
+        Args:
+            spec: Comma-separated name:threshold pairs; an empty spec disables prefiltering.
+
+        Returns:
+            PrefilterCascade with screens in spec order.
+        """
+        screens = []
+        for entry in filter(None, (part.strip() for part in spec.split(','))):
+            name, _, threshold = entry.partition(':')
+            if name not in SCREEN_TYPES:
+                raise ValueError(f"Unknown prefilter screen '{name}', expected one of {list(SCREEN_TYPES)}")
+            screens.append(SCREEN_TYPES[name](float(threshold)))
+        return cls(screens)
+
+    def filter(self, probe: MinutiaTemplate, galleries: list) -> tuple:
+        """
+        Screens (image_id, template) candidates.
+
+        Args:
+            probe: Probe template.
+            galleries: List of (image_id, MinutiaTemplate).
+
+        Returns:
+            Tuple (kept, rejected) lists of (image_id, MinutiaTemplate).
+        """
+        kept = list(galleries)
+        rejected = []
+        for screen in self.screens:
+            if not kept:
+                break
+            mask = screen.apply(probe, [template for _, template in kept])
+            rejected.extend(candidate for candidate, keep in zip(kept, mask) if not keep)
+            kept = [candidate for candidate, keep in zip(kept, mask) if keep]
+        return kept, rejected
+
+    def stats(self) -> dict:
+        """Per-screen {'evaluated', 'rejected'} counters."""
+        return {screen.name: {'evaluated': screen.evaluated, 'rejected': screen.rejected} for screen in self.screens}
+
+
+def build_prefilter_cascade() -> PrefilterCascade:
+    """Builds the cascade from PREFILTER_SCREENS, e.g. 'count_ratio:0.35,type_ratio:0.5' (empty = no prefiltering)."""
+    return PrefilterCascade.from_spec(os.environ.get('PREFILTER_SCREENS', DEFAULT_PREFILTER_SCREENS))
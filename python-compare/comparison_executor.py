@@ -0,0 +1,231 @@
+import atexit
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('serial', 'thread', 'process')
+
+# Сколько опубликованных массивов держать в shared memory между вызовами map (в родителе и в каждом воркере)
+SHARED_ARRAY_CACHE_SIZE = 32
+
+# Блоки, уже подключённые в процессе-воркере: {block_name: (SharedMemory, np.ndarray)}
+_attached_blocks = OrderedDict()
+
+
+def _split_batches(tasks: list, batch_size: int) -> list:
+    """Splits tasks into consecutive batches of at most batch_size items."""
+    return [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+
+
+def _publish_shared_arrays(arrays: dict) -> tuple:
+    """
+    Copies read-only arrays into shared memory blocks.
+
+    Args:
+        arrays: Dict {name: np.ndarray}.
+
+    Returns:
+        Tuple (specs, blocks) where specs is {name: (block_name, shape, dtype)} for workers
+        and blocks are the owning SharedMemory handles to unlink after use.
+    """
+    specs = {}
+    blocks = []
+    try:
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            specs[name] = (block.name, array.shape, array.dtype)
+    except Exception:
+        _release_shared_arrays(blocks)
+        raise
+    return specs, blocks
+
+
+def _release_shared_arrays(blocks: list) -> None:
+    """Closes and unlinks shared memory blocks owned by the parent process."""
+    for block in blocks:
+        try:
+            block.close()
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach_shared_array(block_name: str, shape: tuple, dtype) -> np.ndarray:
+    """
+    Worker side: returns a view of a published array, attaching its block on first use.
+
+    Blocks stay attached across batches and map calls so that the arrays of one probe are mapped
+    once per worker; the least recently used blocks are detached beyond SHARED_ARRAY_CACHE_SIZE.
+    """
+    entry = _attached_blocks.get(block_name)
+    if entry is None:
+        block = shared_memory.SharedMemory(name=block_name)
+        entry = _attached_blocks[block_name] = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+        while len(_attached_blocks) > SHARED_ARRAY_CACHE_SIZE:
+            _, (stale_block, _) = _attached_blocks.popitem(last=False)
+            try:
+                stale_block.close()
+            except BufferError:
+                # Вид на блок ещё жив - отображение освободится вместе с ним
+                pass
+    else:
+        _attached_blocks.move_to_end(block_name)
+    return entry[1]
+
+
+def _run_shared_batch(fn, specs: dict, batch: list) -> list:
+    """Worker entry point: attaches shared arrays (cached per worker) and runs fn on one batch."""
+    arrays = {name: _attach_shared_array(block_name, shape, dtype)
+              for name, (block_name, shape, dtype) in specs.items()}
+    return fn(arrays, batch)
+
+
+class ComparisonExecutor:
+    """
+    Long-lived executor for comparator work with serial, thread and process backends.
+
+    Work is expressed as a module-level function fn(arrays, batch) -> list applied to batches of
+    small tasks. The read-only arrays are shared by every batch instead of being pickled into each
+    task. With the process backend they are copied into shared memory once per array object and
+    reused by later map calls with the same object (the probe arrays while one probe is compared
+    against every gallery), so arrays passed to map must not be modified afterwards.
+
+    The process pool starts its workers with forkserver: forking a parent whose Numba threading
+    layer is already running (warm_up) leaves TBB state in the children and hangs them at exit.
+    """
+
+    def __init__(self, backend: str = 'process', max_workers: int = None, batch_size: int = 32):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown executor backend '{backend}', expected one of {BACKENDS}")
+        self.backend = backend
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = max(1, batch_size)
+        self._pool = None
+        self._lock = threading.Lock()
+        # id(array) -> (array, spec, block); сам массив держится, чтобы id не переиспользовался
+        self._published = OrderedDict()
+
+    def _get_pool(self):
+        """Creates the underlying pool on first use and keeps it for the container lifetime."""
+        with self._lock:
+            if self._pool is None:
+                if self.backend == 'process':
+                    try:
+                        self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                         mp_context=multiprocessing.get_context('forkserver'))
+                    except (OSError, ValueError) as e:
+                        # AWS Lambda has no /dev/shm, so multiprocessing primitives are unavailable
+                        logger.warning(f"Process pool unavailable ({e}), falling back to thread backend")
+                        self.backend = 'thread'
+                if self.backend == 'thread':
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def map(self, fn, arrays: dict, tasks: list) -> list:
+        """
+        Applies fn to batches of tasks and concatenates the results in task order.
+
+        Args:
+            fn: Module-level function fn(arrays, batch) -> list (must be picklable).
+            arrays: Dict {name: np.ndarray} of read-only inputs shared by every batch.
+            tasks: List of small picklable task descriptors.
+
+        Returns:
+            Concatenated list of results.
+        """
+        if not tasks:
+            return []
+        batch_size = max(self.batch_size, math.ceil(len(tasks) / self.max_workers))
+        batches = _split_batches(tasks, batch_size)
+        if self.backend == 'serial' or len(batches) == 1:
+            return [result for batch in batches for result in fn(arrays, batch)]
+
+        pool = self._get_pool()
+        if self.backend == 'thread':
+            futures = [pool.submit(fn, arrays, batch) for batch in batches]
+            return [result for future in futures for result in future.result()]
+
+        try:
+            specs = self._publish(arrays)
+        except OSError as e:
+            logger.warning(f"Shared memory unavailable ({e}), running batches serially")
+            return [result for batch in batches for result in fn(arrays, batch)]
+        try:
+            futures = [pool.submit(_run_shared_batch, fn, specs, batch) for batch in batches]
+            return [result for future in futures for result in future.result()]
+        except BrokenProcessPool:
+            # Drop the broken pool so the next call starts a fresh one
+            self.shutdown()
+            raise
+
+    def _publish(self, arrays: dict) -> dict:
+        """
+        Returns worker specs of arrays, copying into shared memory only objects not published yet.
+
+        The least recently used blocks are unlinked beyond SHARED_ARRAY_CACHE_SIZE; workers keep
+        their own mapping of a block until they detach it.
+        """
+        specs = {}
+        with self._lock:
+            for name, array in arrays.items():
+                entry = self._published.get(id(array))
+                if entry is None:
+                    block_specs, blocks = _publish_shared_arrays({name: array})
+                    entry = self._published[id(array)] = (array, block_specs[name], blocks[0])
+                else:
+                    self._published.move_to_end(id(array))
+                specs[name] = entry[1]
+            # Массивы текущего вызова - самые свежие, поэтому вытесняются только старые
+            while len(self._published) > max(SHARED_ARRAY_CACHE_SIZE, len(arrays)):
+                _, (_, _, block) = self._published.popitem(last=False)
+                _release_shared_arrays([block])
+        return specs
+
+    def shutdown(self) -> None:
+        """Shuts the pool down and unlinks published arrays; a new pool is created on the next map call."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            _release_shared_arrays([block for _, _, block in self._published.values()])
+            self._published.clear()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ComparisonExecutor:
+    """
+    Returns the process-wide executor, creating it once per warm container.
+
+    Configured through COMPARATOR_BACKEND (serial/thread/process), COMPARATOR_WORKERS and
+    COMPARATOR_BATCH_SIZE environment variables.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = int(os.environ.get('COMPARATOR_WORKERS', '0'))
+            _executor = ComparisonExecutor(
+                backend=os.environ.get('COMPARATOR_BACKEND', 'process'),
+                max_workers=workers or None,
+                batch_size=int(os.environ.get('COMPARATOR_BATCH_SIZE', '32'))
+            )
+            # Блоки shared memory не должны пережить контейнер
+            atexit.register(_executor.shutdown)
+            logger.info(f"Comparator executor created: backend={_executor.backend}, "
+                        f"workers={_executor.max_workers}, batch_size={_executor.batch_size}")
+        return _executor
@@ -0,0 +1,66 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Stages of the compare path, in pipeline order
+STAGES = ('scan', 'query', 'decode', 'pair_metrics', 'local', 'global', 'write')
+
+
+class ComparisonMetrics:
+    """
+    Per-invocation stage timings and counters of the compare path.
+
+    Stage times are summed across threads (loader threads and the matching thread run concurrently),
+    so they measure work per stage rather than wall-clock time. Updates take a lock for a few
+    additions only, which keeps the overhead per gallery in the microseconds.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stage_ms = dict.fromkeys(STAGES, 0.0)
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Adds the duration of the with-block to a stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, (time.perf_counter() - started) * 1000)
+
+    def add_time(self, stage: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self.stage_ms[stage] = self.stage_ms.get(stage, 0.0) + elapsed_ms
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            Dict with 'stage_ms' (rounded to 0.1 ms), 'counters' and 'total_ms' since creation.
+        """
+        with self._lock:
+            return {
+                'stage_ms': {stage: round(elapsed, 1) for stage, elapsed in self.stage_ms.items()},
+                'counters': dict(self.counters),
+                'total_ms': round((time.perf_counter() - self.started) * 1000, 1)
+            }
+
+
+_metrics = ComparisonMetrics()
+
+
+def start_invocation_metrics() -> ComparisonMetrics:
+    """Starts a fresh metrics collection for the current invocation and makes it the active one."""
+    global _metrics
+    _metrics = ComparisonMetrics()
+    return _metrics
+
+
+def get_metrics() -> ComparisonMetrics:
+    """Returns the active metrics collection (one per invocation; one per process outside the Lambda)."""
+    return _metrics
@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedGroup(NamedTuple):
+    group_id: str
+    galleries: Optional[list]
+    error: Optional[Exception] = None
+
+
+class GalleryPrefetcher:
+    """
+    Iterates over groups while the next groups' galleries are loaded in the background.
+
+    At most `depth` groups are loaded ahead of the consumer, so memory stays bounded while
+    DynamoDB reads and decoding overlap with matching of the current group. Loading errors are
+    delivered per group instead of aborting the iteration.
+
+    Args:
+        load_fn: Callable load_fn(group_id) -> galleries, called on loader threads.
+        group_ids: Groups to load, in consumption order.
+        executor: Thread pool to run load_fn on.
+        depth: Maximum number of groups loaded ahead of the consumer.
+    """
+
+    def __init__(self, load_fn, group_ids: list, executor: ThreadPoolExecutor, depth: int = 2):
+        self._load_fn = load_fn
+        self._pending_ids = deque(group_ids)
+        self._executor = executor
+        self._depth = max(1, depth)
+        self._in_flight = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        self._fill()
+        while self._in_flight:
+            group_id, future = self._in_flight.popleft()
+            self._fill()
+            try:
+                yield LoadedGroup(group_id, future.result())
+            except Exception as e:
+                yield LoadedGroup(group_id, None, e)
+
+    def _fill(self) -> None:
+        while self._pending_ids and len(self._in_flight) < self._depth:
+            group_id = self._pending_ids.popleft()
+            self._in_flight.append((group_id, self._executor.submit(self._load_fn, group_id)))
+
+    def close(self) -> None:
+        """Stops prefetching and cancels loads that have not started yet."""
+        self._pending_ids.clear()
+        while self._in_flight:
+            _, future = self._in_flight.popleft()
+            future.cancel()
+
+
+_loader_pool = None
+_loader_pool_lock = threading.Lock()
+
+
+def get_loader_pool() -> ThreadPoolExecutor:
+    """Returns the process-wide loader thread pool (size from GALLERY_LOADER_WORKERS)."""
+    global _loader_pool
+    with _loader_pool_lock:
+        if _loader_pool is None:
+            workers = int(os.environ.get('GALLERY_LOADER_WORKERS', '4'))
+            _loader_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gallery-loader')
+            logger.info(f"Gallery loader pool created with {workers} workers")
+        return _loader_pool
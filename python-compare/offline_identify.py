@@ -0,0 +1,261 @@
+"""
+Offline 1:N identification over local files, without DynamoDB or S3.
+
+Usage (from python-compare):
+    python offline_identify.py --gallery GALLERY_DIR --probes PROBE_DIR_OR_FILES... [--workers N] [--output out.json]
+                               [--matches-only]
+
+Inputs are binary templates (*.fpmt written by template_codec, legacy *.npz) or fingerprint images
+(*.tif, *.png, ...), which are run through the extractor's steps (python-extract/extract_steps.py).
+A template's center comes from a <name>.json sidecar with the item Metadata (center_x, center_y) or,
+without one, from the minutiae centroid. Gallery files are grouped by the extractor's extract_group_id
+convention (GroupId is the file name up to the first '_').
+
+Every probe is scored against every group with the Lambda's own score_group (prefilter, early exit,
+same thresholds), so the YES/NO results match what the comparator would write to ResultsTable.
+A probe that is also a gallery file is only left out of its own comparisons; the other probes stay
+in the galleries, so the decisions do not depend on --probe-batch.
+Every decision is printed to stdout as a probe<TAB>group<TAB>YES|NO row (only YES rows with
+--matches-only); run statistics go to stderr.
+Work is spread over a process pool; matching inside each worker is single-threaded.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Параллелизм даёт пул процессов, поэтому внутри воркера сравнения идут последовательно
+os.environ.setdefault('COMPARATOR_BACKEND', 'serial')
+os.environ.setdefault('NUMBA_NUM_THREADS', '1')
+os.environ.setdefault('COMPARATOR_WARMUP', '0')
+
+import numpy as np  # noqa: E402
+
+from template_codec import decode_minutiae, records_from_legacy_array  # noqa: E402
+
+TEMPLATE_EXTENSIONS = ('.fpmt', '.npz')
+IMAGE_EXTENSIONS = ('.tif', '.tiff', '.png', '.bmp', '.jpg', '.jpeg')
+# Сырые снимки датасета: <group>_<n>.<ext>; производные (_cropped, _enhanced, _skeleton, _plots) не подходят
+RAW_INPUT_NAME = re.compile(r'^[^_]+_\d+\.[^.]+$')
+DEFAULT_EXTRACTOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'python-extract')
+
+
+def group_id_from_filename(filename: str) -> str:
+    """GroupId by the extractor's extract_group_id convention for dataset images."""
+    return os.path.basename(filename).split('_')[0]
+
+
+def list_inputs(paths: list) -> list:
+    """
+    Expands directories into the template and image files they contain, sorted by name.
+
+    Only raw <group>_<n>.<ext> files are taken from a directory, so derivatives saved next to the
+    dataset images (101_1_cropped.tif, 101_1_plots.png, ...) are not scored as extra impressions.
+    Files named explicitly are taken as they are.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if RAW_INPUT_NAME.match(name))
+        else:
+            files.append(path)
+    return [path for path in files if path.lower().endswith(TEMPLATE_EXTENSIONS + IMAGE_EXTENSIONS)]
+
+
+def load_input(path: str, extractor_path: str) -> tuple:
+    """
+    Reads one template or extracts one image (runs in a worker process).
+
+    Args:
+        path: Template or image file
+        extractor_path: Directory of python-extract, for images
+
+    Returns:
+        Tuple (image_id, records, center, extract_ms, error) where records has the template fields
+        and error is None on success
+    """
+    image_id = os.path.basename(path)
+    started = time.perf_counter()
+    try:
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            if extractor_path not in sys.path:
+                sys.path.append(extractor_path)
+            import cv2
+            from extract_steps import extract_template
+
+            image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                raise ValueError(f"Failed to read {path}")
+            minutiae_array, metadata = extract_template(image)
+            records = records_from_legacy_array(minutiae_array)
+            center = (int(metadata['center_x']), int(metadata['center_y']))
+        else:
+            with open(path, 'rb') as f:
+                records = decode_minutiae(f.read())
+            sidecar = os.path.splitext(path)[0] + '.json'
+            if os.path.exists(sidecar):
+                with open(sidecar) as f:
+                    metadata = json.load(f)
+                center = (int(metadata['center_x']), int(metadata['center_y']))
+            elif len(records):
+                center = (int(np.mean(records['x'])), int(np.mean(records['y'])))
+            else:
+                center = (0, 0)
+        return image_id, records, center, (time.perf_counter() - started) * 1000, None
+    except Exception as e:
+        return image_id, None, None, (time.perf_counter() - started) * 1000, f"{type(e).__name__}: {e}"
+
+
+# Состояние воркера: галерея по группам и построенные шаблоны
+_worker_gallery = {}
+_worker_templates = {}
+
+
+def _init_worker(gallery: dict) -> None:
+    global _worker_gallery
+    _worker_gallery = gallery
+
+
+def _template_for(image_id: str, records: np.ndarray, center: tuple):
+    from minutia_comparison import build_template
+    from minutia_types import assign_unique_ids
+
+    template = _worker_templates.get(image_id)
+    if template is None:
+        minutiae, _ = assign_unique_ids(records, 0)
+        template = _worker_templates[image_id] = build_template(minutiae, center)
+    return template
+
+
+def score_group_task(group_id: str, probes: list) -> dict:
+    """
+    Scores a chunk of probes against one gallery group (runs in a worker process).
+
+    Args:
+        group_id: Gallery group
+        probes: List of (image_id, records, center)
+
+    Returns:
+        Dict with 'results' [(probe_id, group_id, result)], 'failed' probe IDs and the worker's metrics summary
+    """
+    from app import score_group
+    from candidate_prefilter import build_prefilter_cascade
+    from comparison_metrics import start_invocation_metrics
+
+    metrics = start_invocation_metrics()
+    prefilter = build_prefilter_cascade()
+    group_galleries = [(image_id, _template_for(image_id, records, center))
+                       for image_id, records, center in _worker_gallery[group_id]]
+
+    results = []
+    failed = []
+    for image_id, records, center in probes:
+        # Probe не сравнивается только сам с собой: состав группы не зависит от разбиения probe на чанки
+        galleries = [gallery for gallery in group_galleries if gallery[0] != image_id]
+        try:
+            result, _, _, _ = score_group(_template_for(image_id, records, center), galleries, prefilter)
+            results.append((image_id, group_id, result))
+        except Exception:
+            failed.append(image_id)
+    return {'results': results, 'failed': failed, 'metrics': metrics.summary()}
+
+
+def load_all(paths: list, pool: ProcessPoolExecutor, extractor_path: str) -> tuple:
+    """Loads inputs in the pool; returns ({image_id: (records, center)}, errors, extract_ms)."""
+    loaded = {}
+    errors = {}
+    extract_ms = 0.0
+    for image_id, records, center, elapsed_ms, error in pool.map(load_input, paths,
+                                                                 [extractor_path] * len(paths), chunksize=4):
+        extract_ms += elapsed_ms
+        if error is None:
+            loaded[image_id] = (records, center)
+        else:
+            errors[image_id] = error
+    return loaded, errors, extract_ms
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gallery', nargs='+', required=True, help='Gallery directories or files')
+    parser.add_argument('--probes', nargs='+', required=True, help='Probe directories or files')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--probe-batch', type=int, default=16, help='Probes per (group, probes) task')
+    parser.add_argument('--extractor-path', default=DEFAULT_EXTRACTOR_PATH,
+                        help='python-extract directory, used for image inputs')
+    parser.add_argument('--output', help='Write results and statistics as JSON to this file')
+    parser.add_argument('--matches-only', action='store_true', help='Print only YES decisions')
+    args = parser.parse_args(argv)
+
+    gallery_paths = list_inputs(args.gallery)
+    probe_paths = list_inputs(args.probes)
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as loader_pool:
+        gallery, gallery_errors, gallery_extract_ms = load_all(gallery_paths, loader_pool, args.extractor_path)
+        probes, probe_errors, probe_extract_ms = load_all(probe_paths, loader_pool, args.extractor_path)
+    load_seconds = time.perf_counter() - started
+
+    groups = {}
+    for image_id, (records, center) in gallery.items():
+        groups.setdefault(group_id_from_filename(image_id), []).append((image_id, records, center))
+    probe_items = [(image_id, records, center) for image_id, (records, center) in probes.items()]
+    tasks = [(group_id, probe_items[start:start + args.probe_batch])
+             for group_id in sorted(groups) for start in range(0, len(probe_items), args.probe_batch)]
+
+    started = time.perf_counter()
+    results = []
+    failed = set()
+    counters = {}
+    stage_ms = {}
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(groups,)) as pool:
+        for task_result in pool.map(score_group_task, *zip(*tasks)) if tasks else []:
+            results.extend(task_result['results'])
+            failed.update(task_result['failed'])
+            for name, value in task_result['metrics']['counters'].items():
+                counters[name] = counters.get(name, 0) + value
+            for stage, elapsed in task_result['metrics']['stage_ms'].items():
+                stage_ms[stage] = stage_ms.get(stage, 0.0) + elapsed
+    match_seconds = time.perf_counter() - started
+
+    results.sort(key=lambda item: (item[0], item[1]))
+    comparisons = counters.get('comparisons', 0)
+    stats = {
+        'gallery_files': len(gallery_paths),
+        'gallery_loaded': len(gallery),
+        'groups': len(groups),
+        'probes_loaded': len(probes),
+        'load_errors': {**gallery_errors, **probe_errors},
+        'failed_probes': sorted(failed),
+        'workers': args.workers,
+        'load_seconds': round(load_seconds, 3),
+        'extract_ms_total': round(gallery_extract_ms + probe_extract_ms, 1),
+        'match_seconds': round(match_seconds, 3),
+        'decisions': len(results),
+        'comparisons': comparisons,
+        'comparisons_per_sec': round(comparisons / match_seconds, 1) if match_seconds else None,
+        'probes_per_sec': round(len(probes) / match_seconds, 2) if match_seconds else None,
+        'counters': counters,
+        'stage_ms': {stage: round(elapsed, 1) for stage, elapsed in stage_ms.items()}
+    }
+
+    for probe_id, group_id, result in results:
+        if result == "YES" or not args.matches_only:
+            print(f"{probe_id}\t{group_id}\t{result}")
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'results': [{'ImageId': probe_id, 'GroupId': group_id, 'Result': result}
+                            for probe_id, group_id, result in results],
+                'stats': stats
+            }, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,21 @@
 import numpy as np
 import logging
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# Пороги на основе экспериментальных данных из scan3.ipynb
+POS_THRESHOLD = 50.0    # Порог для позитивной оценки
+MEA_THRESHOLD = 30.0    # Порог для средней оценки
+
+# Адаптивный порог - если одна оценка очень высокая,
+# можно смягчить требования к другой
+ADAPTIVE_POS_HIGH = 80.0  # Высокий порог для позитивной оценки
+ADAPTIVE_MEA_LOW = 15.0   # Пониженный порог для средней оценки
+
+# Верхняя граница оценки compare_templates: число совпадений не превышает min(n, m)
+MAX_COMPARISON_SCORE = 100.0
+
 def aggregate_group_scores(group_scores: list, group_size: int) -> tuple:
     """
     Агрегирует оценки сравнения для группы и нормализует их.
@@ -62,15 +75,6 @@ def evaluate_thresholds(normalized_pos: float, normalized_mea: float) -> bool:
     Returns:
         True если совпадение найдено (YES), False иначе (NO)
     """
-    # Пороги на основе экспериментальных данных из scan3.ipynb
-    POS_THRESHOLD = 50.0    # Порог для позитивной оценки
-    MEA_THRESHOLD = 30.0    # Порог для средней оценки
-
-    # Адаптивный порог - если одна оценка очень высокая,
-    # можно смягчить требования к другой
-    ADAPTIVE_POS_HIGH = 80.0  # Высокий порог для позитивной оценки
-    ADAPTIVE_MEA_LOW = 15.0   # Пониженный порог для средней оценки
-
     # Основная логика: обе оценки должны превышать базовые пороги
     basic_match = (normalized_pos >= POS_THRESHOLD and
                    normalized_mea >= MEA_THRESHOLD)
@@ -86,3 +90,93 @@ def evaluate_thresholds(normalized_pos: float, normalized_mea: float) -> bool:
                 f"basic={basic_match}, adaptive={adaptive_match}, result={result}")
 
     return result
+
+
+class IncrementalGroupAggregator:
+    """
+    Инкрементальная агрегация оценок группы с досрочным решением.
+
+    normalized_pos - это максимум оценок, normalized_mea = сумма валидных оценок / group_size,
+    поэтому после каждой оценки известны границы итоговых значений: оставшиеся сравнения
+    могут дать от 0 до MAX_COMPARISON_SCORE каждое. evaluate_thresholds монотонна по обеим
+    оценкам, так что если нижние границы уже проходят пороги - результат YES, а если даже
+    верхние не проходят - результат NO, и оставшиеся gallery сравнивать не нужно.
+
+    Args:
+        group_size: Размер группы (количество изображений)
+        max_score: Верхняя граница одной оценки сравнения
+    """
+
+    def __init__(self, group_size: int, max_score: float = MAX_COMPARISON_SCORE):
+        self.group_size = group_size
+        self.max_score = max_score
+        self.processed = 0
+        self.valid_count = 0
+        self.score_sum = 0.0
+        self.max_value = 0.0
+        self.decision = None if group_size > 0 else False
+
+    @property
+    def remaining(self) -> int:
+        """Количество gallery, которые ещё не учтены."""
+        return max(self.group_size - self.processed, 0)
+
+    @property
+    def decided(self) -> bool:
+        return self.decision is not None
+
+    @property
+    def saved(self) -> int:
+        """Сколько сравнений сэкономлено досрочным решением."""
+        return self.remaining if self.decided else 0
+
+    def add(self, score: Optional[float]) -> Optional[bool]:
+        """
+        Учитывает одну gallery группы.
+
+        Args:
+            score: Оценка сравнения; None или NaN - сравнение не удалось (gallery учитывается только в group_size)
+
+        Returns:
+            True/False если результат группы уже определён, иначе None
+        """
+        self.processed += 1
+        if score is not None and not np.isnan(score):
+            self.valid_count += 1
+            self.score_sum += score
+            self.max_value = max(self.max_value, score)
+        if self.decision is None:
+            self.decision = self._decide()
+        return self.decision
+
+    def bounds(self) -> tuple:
+        """
+        Границы итоговых оценок с учётом оставшихся сравнений.
+
+        Returns:
+            Tuple ((pos_low, mea_low), (pos_high, mea_high))
+        """
+        pos_low, mea_low = self.result()
+        remaining = self.remaining
+        if remaining == 0:
+            return (pos_low, mea_low), (pos_low, mea_low)
+        pos_high = max(pos_low, self.max_score)
+        mea_high = (self.score_sum + remaining * self.max_score) / self.group_size
+        return (pos_low, mea_low), (pos_high, mea_high)
+
+    def result(self) -> tuple:
+        """
+        Текущие (normalized_pos, normalized_mea); после учёта всех gallery совпадают
+        с aggregate_group_scores.
+        """
+        if self.valid_count == 0 or self.group_size == 0:
+            return 0.0, 0.0
+        return self.max_value, self.score_sum / self.group_size
+
+    def _decide(self) -> Optional[bool]:
+        (pos_low, mea_low), (pos_high, mea_high) = self.bounds()
+        if evaluate_thresholds(pos_low, mea_low):
+            return True
+        if not evaluate_thresholds(pos_high, mea_high):
+            return False
+        return None
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+SCORE_FORMAT = struct.Struct('<d')
+
+
+def score_key(probe_digest: str, gallery_digest: str, params_version: str) -> str:
+    """Cache key of one probe-vs-gallery comparison (the order of probe and gallery matters)."""
+    return f"{params_version}:{probe_digest}:{gallery_digest}"
+
+
+class FileScoreStore:
+    """
+    Shared score tier backed by a directory, one small file per key.
+
+    Files are written to a temporary name and renamed, so concurrent writers never expose partial
+    entries. Suitable for tests and single-host deployments; entries do not expire.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, key: str) -> Optional[float]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return SCORE_FORMAT.unpack(f.read())[0]
+        except (FileNotFoundError, struct.error):
+            return None
+
+    def put(self, key: str, score: float) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SCORE_FORMAT.pack(score))
+        os.replace(tmp_path, path)
+
+
+class RedisScoreStore:
+    """Shared score tier in Redis (e.g. the ElastiCache cluster); entries expire after ttl_seconds."""
+
+    def __init__(self, url: str, ttl_seconds: int = 0):
+        import redis
+
+        self.ttl_seconds = ttl_seconds or None
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key: str) -> Optional[float]:
+        value = self._client.get(key)
+        return None if value is None else SCORE_FORMAT.unpack(value)[0]
+
+    def put(self, key: str, score: float) -> None:
+        self._client.set(key, SCORE_FORMAT.pack(score), ex=self.ttl_seconds)
+
+
+class ScoreCache:
+    """
+    Two-tier cache of comparison scores keyed by (probe digest, gallery digest, matcher parameter version).
+
+    The in-process LRU tier serves repeats within a warm container; the optional shared tier serves
+    stream retries, replays and duplicate uploads landing on other containers. Shared tier errors are
+    logged and treated as misses, so an unavailable store never fails a comparison.
+
+    Args:
+        max_entries: LRU tier capacity (0 disables the tier).
+        shared: Optional store with get(key) and put(key, score).
+    """
+
+    def __init__(self, max_entries: int, shared=None):
+        self.max_entries = max_entries
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[float]:
+        """
+        Looks the score up in the LRU tier, then in the shared tier.
+
+        Args:
+            key: Key from score_key.
+
+        Returns:
+            Cached score or None on a miss.
+        """
+        with self._lock:
+            score = self._entries.get(key)
+            if score is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return score
+
+        if self.shared is not None:
+            try:
+                score = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"Shared score cache read failed: {str(e)}")
+                score = None
+            if score is not None:
+                self._put_local(key, score)
+                with self._lock:
+                    self.shared_hits += 1
+                return score
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, score: float) -> None:
+        """Stores a score in both tiers."""
+        self._put_local(key, score)
+        if self.shared is not None:
+            try:
+                self.shared.put(key, score)
+            except Exception as e:
+                logger.warning(f"Shared score cache write failed: {str(e)}")
+
+    def _put_local(self, key: str, score: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = score
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'shared_hits': self.shared_hits, 'misses': self.misses}
+
+
+def open_shared_store(url: str, ttl_seconds: int = 0):
+    """
+    Opens the shared tier from a URL: redis://host:port/db (rediss:// for TLS) or file:///directory.
+
+    Returns:
+        Store instance, or None if the URL is empty or the store cannot be opened.
+    """
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    try:
+        if scheme in ('redis', 'rediss'):
+            return RedisScoreStore(url, ttl_seconds)
+        if scheme == 'file':
+            return FileScoreStore(urlparse(url).path)
+    except Exception as e:
+        logger.warning(f"Shared score cache {url} unavailable ({e}), using the in-process tier only")
+        return None
+    raise ValueError(f"Unsupported score cache URL scheme '{scheme}', expected redis, rediss or file")
+
+
+_score_cache = None
+_score_cache_lock = threading.Lock()
+
+
+def get_score_cache() -> ScoreCache:
+    """
+    Returns the process-wide score cache.
+
+    Configured through SCORE_CACHE_MAX_ENTRIES (LRU tier size, 0 disables it), SCORE_CACHE_URL
+    (shared tier, unset for none) and SCORE_CACHE_TTL_SECONDS (Redis entry lifetime, 0 for no expiry).
+    """
+    global _score_cache
+    with _score_cache_lock:
+        if _score_cache is None:
+            max_entries = int(os.environ.get('SCORE_CACHE_MAX_ENTRIES', '100000'))
+            url = os.environ.get('SCORE_CACHE_URL', '')
+            shared = open_shared_store(url, int(os.environ.get('SCORE_CACHE_TTL_SECONDS', '604800')))
+            _score_cache = ScoreCache(max_entries, shared)
+            logger.info(f"Score cache created: {max_entries} local entries, "
+                        f"shared tier {type(shared).__name__ if shared is not None else 'disabled'}")
+        return _score_cache
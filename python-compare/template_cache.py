@@ -0,0 +1,93 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from minutia_comparison import MinutiaTemplate
+
+logger = logging.getLogger(__name__)
+
+
+class GalleryTemplateCache:
+    """
+    Process-level LRU cache of decoded gallery templates and their pair metrics.
+
+    Entries are keyed by ImageId and tagged with the item's Timestamp; a lookup with a different
+    Timestamp treats the entry as stale and evicts it. The cache lives for the whole warm container,
+    so repeated probes skip DynamoDB reads, decoding and pair-metric computation for known galleries.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, image_id: str, version) -> Optional[MinutiaTemplate]:
+        """
+        Returns the cached template if present and built from the same item version.
+
+        Args:
+            image_id: Gallery ImageId.
+            version: Item Timestamp the caller expects.
+
+        Returns:
+            MinutiaTemplate or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(image_id)
+            if entry is not None and entry[0] != version:
+                self._remove(image_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(image_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, image_id: str, version, template: MinutiaTemplate) -> None:
+        """Stores a template and evicts least recently used entries beyond the memory budget."""
+        size = template.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if image_id in self._entries:
+                self._remove(image_id)
+            self._entries[image_id] = (version, template)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _remove(self, image_id: str) -> None:
+        _, template = self._entries.pop(image_id)
+        self.nbytes -= template.nbytes
+
+
+_template_cache = None
+_template_cache_lock = threading.Lock()
+
+
+def get_template_cache() -> GalleryTemplateCache:
+    """Returns the process-wide gallery template cache (budget from TEMPLATE_CACHE_MAX_MB)."""
+    global _template_cache
+    with _template_cache_lock:
+        if _template_cache is None:
+            max_mb = int(os.environ.get('TEMPLATE_CACHE_MAX_MB', '256'))
+            _template_cache = GalleryTemplateCache(max_mb * 1024 * 1024)
+            logger.info(f"Gallery template cache created with {max_mb} MB budget")
+        return _template_cache
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули компаратора импортируются как из каталога python-compare
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
@@ -0,0 +1,34 @@
+import numpy as np
+
+import offline_identify
+from benchmarks.synthetic import distort, generate_template
+from template_codec import encode_minutiae
+
+GROUPS = 3
+IMPRESSIONS = 3
+
+
+def write_dataset(directory) -> None:
+    """Writes GROUPS fingers with IMPRESSIONS mated impressions each as <group>_<n>.fpmt templates."""
+    rng = np.random.default_rng(7)
+    for group in range(101, 101 + GROUPS):
+        finger = generate_template(40, rng)
+        for impression in range(1, IMPRESSIONS + 1):
+            (directory / f'{group}_{impression}.fpmt').write_bytes(encode_minutiae(distort(finger, rng)))
+
+
+def identify(directory, probe_batch: int, capsys) -> list:
+    capsys.readouterr()
+    offline_identify.main(['--gallery', str(directory), '--probes', str(directory), '--workers', '1',
+                           '--probe-batch', str(probe_batch)])
+    return capsys.readouterr().out.splitlines()
+
+
+def test_decisions_do_not_depend_on_probe_batch(tmp_path, capsys):
+    write_dataset(tmp_path)
+
+    single = identify(tmp_path, 1, capsys)
+    batched = identify(tmp_path, GROUPS * IMPRESSIONS, capsys)
+
+    assert len(single) == (GROUPS * IMPRESSIONS) * GROUPS
+    assert batched == single
@@ -1,17 +1,16 @@
 import json
 import os
 import time
+import shutil
 import logging
 from typing import Dict, List, Tuple, Optional, NamedTuple
 from dataclasses import dataclass
-import boto3
-import numpy as np
 
 # Импорт ОРИГИНАЛЬНЫХ проверенных алгоритмов (без изменений)
-from fs_utils import read_file_as_opencv
-from extract_steps import crop_image, create_enhanced_version, get_centroid, shift_minutiae
-from cv_filter_utils import get_image_skeletons, calculate_minutiae
+from fs_utils import read_file_as_opencv, s3_client
+from extract_steps import extract_template
 from dynamo_utils import save_minutiae_to_dynamo, save_group_to_dynamo
+from record_pipeline import get_pipeline
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -20,6 +19,29 @@ handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
 logger.addHandler(handler)
 
 
+def prepare_numba_cache() -> None:
+    """
+    Seeds NUMBA_CACHE_DIR from the kernel cache compiled into the image.
+
+    Numba only uses writable cache directories and the task root is read-only, so the bundled
+    numba_cache directory is copied to NUMBA_CACHE_DIR (under /tmp) before the kernels load.
+    """
+    cache_dir = os.environ.get('NUMBA_CACHE_DIR')
+    bundled_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'numba_cache')
+    if not cache_dir or os.path.abspath(cache_dir) == bundled_dir or os.path.isdir(cache_dir):
+        return
+    if os.path.isdir(bundled_dir):
+        shutil.copytree(bundled_dir, cache_dir)
+
+
+# Ядро трассировки гребней и таблицы минуций готовятся при инициализации контейнера, а не на первом изображении
+prepare_numba_cache()
+import ridge_tracing  # noqa: E402,F401
+from minutiae_tables import get_extractor_tables  # noqa: E402
+
+get_extractor_tables()
+
+
 class ProcessingMetrics(NamedTuple):
     load_time_ms: float
     crop_time_ms: float
@@ -52,9 +74,8 @@ def extract_group_id(filename: str, service_type: str) -> Optional[str]:
 
 
 def process_fingerprint_image(bucket: str, key: str, service_type: str,
-                             table_name: str, groups_table: str) -> ProcessingResult:
+                             table_name: str, groups_table: str, extract=extract_template) -> ProcessingResult:
     start_total = time.time()
-    s3_client = boto3.client('s3')
 
     try:
         logger.info(f"Processing image: {key}")
@@ -68,46 +89,10 @@ def process_fingerprint_image(bucket: str, key: str, service_type: str,
         load_time = (time.time() - step_start) * 1000
         logger.debug(f"Read image in {load_time:.1f}ms")
 
-        step_start = time.time()
-        crop, row, column, row_offset, column_offset = crop_image(img)
-        crop_time = (time.time() - step_start) * 1000
-        logger.debug(f"Crop image in {crop_time:.1f}ms")
-
-        step_start = time.time()
-        enhanced, mask = create_enhanced_version(crop)
-        enhance_time = (time.time() - step_start) * 1000
-        logger.debug(f"Enhance image in {enhance_time:.1f}ms")
-
-        step_start = time.time()
-        skeleton, binary_skeleton = get_image_skeletons(enhanced)
-        skeleton_time = (time.time() - step_start) * 1000
-        logger.debug(f"Generate skeletons in {skeleton_time:.1f}ms")
-
-        step_start = time.time()
-        minutiae = calculate_minutiae(mask, skeleton, binary_skeleton)
-        minutiae_time = (time.time() - step_start) * 1000
-        logger.debug(f"Calculate minutiae in {minutiae_time:.1f}ms, count={len(minutiae)}")
-
-        center_x, center_y = get_centroid(minutiae)
-        logger.debug(f"Centroid: center_x={center_x}, center_y={center_y}")
-
-        minutiae_array = np.array([
-            (x, y, int(1 if term else 0), theta)
-            for x, y, term, theta in minutiae
-        ], dtype=np.float32)
-
-        minutiae_array = shift_minutiae(minutiae_array, int(column), int(row))
-        center_x -= int(column)
-        center_y -= int(row)
-
-        metadata = {
-            'width_shift': int(column),
-            'height_shift': int(row),
-            'offset_row': int(row_offset),
-            'offset_col': int(column_offset),
-            'center_x': center_x,
-            'center_y': center_y
-        }
+        timings = {}
+        minutiae_array, metadata = extract(img, timings)
+        logger.debug(f"Extracted {len(minutiae_array)} minutiae: {timings}, "
+                     f"center_x={metadata['center_x']}, center_y={metadata['center_y']}")
 
         step_start = time.time()
         save_minutiae_to_dynamo(
@@ -127,20 +112,20 @@ def process_fingerprint_image(bucket: str, key: str, service_type: str,
 
         metrics = ProcessingMetrics(
             load_time_ms=load_time,
-            crop_time_ms=crop_time,
-            enhance_time_ms=enhance_time,
-            skeleton_time_ms=skeleton_time,
-            minutiae_time_ms=minutiae_time,
+            crop_time_ms=timings['crop'],
+            enhance_time_ms=timings['enhance'],
+            skeleton_time_ms=timings['skeleton'],
+            minutiae_time_ms=timings['minutiae'],
             save_time_ms=save_time,
             total_time_ms=total_time
         )
 
-        logger.info(f"Successfully processed {key}: {len(minutiae)} minutiae in {total_time:.1f}ms")
+        logger.info(f"Successfully processed {key}: {len(minutiae_array)} minutiae in {total_time:.1f}ms")
 
         return ProcessingResult(
             image_key=key,
             success=True,
-            minutiae_count=len(minutiae),
+            minutiae_count=len(minutiae_array),
             group_id=group_id,
             metrics=metrics
         )
@@ -169,23 +154,14 @@ def lambda_handler(event: Dict, context) -> Dict:
     logger.info(f"Handler started: service={service_type}, request_id={request_id}")
     logger.info(f"Processing {len(event.get('Records', []))} S3 records")
 
-    results: List[ProcessingResult] = []
+    results: List[Optional[ProcessingResult]] = []
+    records: List[Tuple[int, str, str]] = []
 
     for record in event.get('Records', []):
         try:
             s3_data = record['s3']
-            bucket = s3_data['bucket']['name']
-            key = s3_data['object']['key']
-
-            result = process_fingerprint_image(
-                bucket=bucket,
-                key=key,
-                service_type=service_type,
-                table_name=table_name,
-                groups_table=groups_table
-            )
-
-            results.append(result)
+            records.append((len(results), s3_data['bucket']['name'], s3_data['object']['key']))
+            results.append(None)
 
         except Exception as e:
             logger.error(f"Error processing S3 record: {str(e)}", exc_info=True)
@@ -195,6 +171,21 @@ def lambda_handler(event: Dict, context) -> Dict:
                 error_message=f"Failed to parse S3 record: {str(e)}"
             ))
 
+    def process_record(item: Tuple[int, str, str], extract) -> ProcessingResult:
+        _, bucket, key = item
+        return process_fingerprint_image(
+            bucket=bucket,
+            key=key,
+            service_type=service_type,
+            table_name=table_name,
+            groups_table=groups_table,
+            extract=extract
+        )
+
+    # Загрузка и запись идут в потоках ввода-вывода, извлечение - в ограниченном CPU-пуле
+    for (position, _, _), result in zip(records, get_pipeline().map(process_record, records)):
+        results[position] = result
+
     successful = sum(1 for r in results if r.success)
     total_minutiae = sum(r.minutiae_count for r in results if r.success)
     avg_time = sum(r.metrics.total_time_ms for r in results if r.metrics) / len(results) if results else 0
@@ -1,22 +1,42 @@
 import math
+import os
+from functools import lru_cache
 import cv2
 import numexpr as ne
 import numpy as np
 from typing import List, Tuple
 
+# Число ориентаций банка фильтров Габора
+GABOR_ORIENTATIONS = 8
+# Шаг квантования периода гребней для кэша банков фильтров, пикселей. По умолчанию 0 - период
+# берётся как есть, результат совпадает с filter2D, а банк строится для каждого изображения без кэша;
+# крупный шаг чаще попадает в кэш, но сдвигает часть минуций
+GABOR_PERIOD_STEP = float(os.environ.get('GABOR_PERIOD_STEP', '0'))
+
+def cache_per_quantized_period(maxsize: int):
+    """lru_cache(maxsize) when GABOR_PERIOD_STEP > 0, otherwise no caching.
+
+    Unquantized periods are float averages that almost never repeat between images, so a cache
+    would only keep filter banks (tens of MB of spectra) that are never hit.
+    """
+    def decorate(function):
+        return lru_cache(maxsize=maxsize)(function) if GABOR_PERIOD_STEP > 0 else function
+    return decorate
+
+def gabor_kernel_size(ridge_period: np.float64) -> tuple[int, int]:
+    """Odd (width, height) of the Gabor kernel for a ridge period."""
+    size = int(round(2 * ridge_period + 1))
+    if size % 2 == 0:
+        size += 1
+    return size, size
+
 def create_gabor_kernel(ridge_period: np.float64, orientation: np.float64) -> np.ndarray:
     """Create Gabor kernel for ridge enhancement. Optimized with numba."""
-    def calculate_kernel_size(period: np.float64) -> tuple[int, int]:
-        size = int(round(2 * period + 1))
-        if size % 2 == 0:
-            size += 1
-        return size, size
-
     def calculate_sigma(period: np.float64) -> float:
         return period * 1.5 / ((6 * math.log(10)) ** 0.5)
 
     kernel = cv2.getGaborKernel(
-        calculate_kernel_size(ridge_period),
+        gabor_kernel_size(ridge_period),
         calculate_sigma(ridge_period),
         np.pi / 2 - orientation,
         float(ridge_period),
@@ -66,17 +86,57 @@ def get_local_ridge_frequency(image: np.ndarray) -> np.float64:
     )[0]
     return np.average(local_maximums[1:] - local_maximums[:-1])
 
+def quantize_ridge_period(ridge_period: np.float64) -> float:
+    """Round the ridge period to GABOR_PERIOD_STEP so images with close periods share a filter bank."""
+    if GABOR_PERIOD_STEP <= 0:
+        return float(ridge_period)
+    return round(float(ridge_period) / GABOR_PERIOD_STEP) * GABOR_PERIOD_STEP
+
+@cache_per_quantized_period(maxsize=64)
+def gabor_kernel_bank(ridge_period: float) -> tuple:
+    """Gabor kernels for GABOR_ORIENTATIONS orientations, cached per quantized ridge period."""
+    return tuple(create_gabor_kernel(ridge_period, angle)
+                 for angle in np.arange(0, np.pi, np.pi / GABOR_ORIENTATIONS))
+
+@cache_per_quantized_period(maxsize=8)
+def gabor_bank_spectra(ridge_period: float, dft_shape: tuple) -> tuple:
+    """CCS-packed DFTs of the flipped bank kernels zero-padded to dft_shape, for correlation by multiplication."""
+    spectra = []
+    for kernel in gabor_kernel_bank(ridge_period):
+        padded = np.zeros(dft_shape, dtype=np.float32)
+        padded[:kernel.shape[0], :kernel.shape[1]] = kernel[::-1, ::-1]
+        spectra.append(cv2.dft(padded, nonzeroRows=kernel.shape[0]))
+    return tuple(spectra)
+
 def get_enhanced_image(image: np.ndarray, mask: np.ndarray, orientations: np.ndarray, ridge_period: np.float64) -> np.ndarray:
-    """Enhance image using Gabor filters."""
-    angle_steps = 8
-    gabor_filter = [create_gabor_kernel(ridge_period, angle) for angle in np.arange(0, np.pi, np.pi / angle_steps)]
-    negative_image = 255 - image
-    negative_gabor_filtered = np.array([cv2.filter2D(negative_image, cv2.CV_32F, gabor_kernel)
-                                        for gabor_kernel in gabor_filter])
-    y_coords, x_coords = np.indices(image.shape)
-    gabor_filter_orientation_indices = (np.round(((orientations % np.pi) / np.pi) * angle_steps)
-                                        .astype(np.int32) % angle_steps)
-    gabor_filtered_image = negative_gabor_filtered[gabor_filter_orientation_indices, y_coords, x_coords]
+    """Enhance image using Gabor filters.
+
+    The bank is applied in the frequency domain: the image (reflect-101 padded, as filter2D does)
+    is transformed once and each orientation is a spectrum multiply and an inverse DFT, whose
+    result is copied only into the pixels of that orientation, without an 8×H×W stack.
+    """
+    period = quantize_ridge_period(ridge_period)
+    # Размер ядра считается по периоду: банк строится один раз, внутри gabor_bank_spectra
+    radius = gabor_kernel_size(period)[0] // 2
+    height, width = image.shape
+    padded_height, padded_width = height + 2 * radius, width + 2 * radius
+    dft_shape = (cv2.getOptimalDFTSize(padded_height), cv2.getOptimalDFTSize(padded_width))
+
+    negative_image = np.zeros(dft_shape, dtype=np.float32)
+    negative_image[:padded_height, :padded_width] = cv2.copyMakeBorder(
+        255 - image, radius, radius, radius, radius, cv2.BORDER_REFLECT_101)
+    image_spectrum = cv2.dft(negative_image, nonzeroRows=padded_height)
+
+    gabor_filter_orientation_indices = (np.round(((orientations % np.pi) / np.pi) * GABOR_ORIENTATIONS)
+                                        .astype(np.int32) % GABOR_ORIENTATIONS)
+    gabor_filtered_image = np.empty(image.shape, dtype=np.float32)
+    for orientation, kernel_spectrum in enumerate(gabor_bank_spectra(period, dft_shape)):
+        filtered = cv2.idft(cv2.mulSpectrums(image_spectrum, kernel_spectrum, 0),
+                            flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+        # Полная свёртка сдвинута на 2 * radius: отступ паддинга плюс центр ядра
+        np.copyto(gabor_filtered_image,
+                  filtered[2 * radius:2 * radius + height, 2 * radius:2 * radius + width],
+                  where=gabor_filter_orientation_indices == orientation)
     return mask & np.clip(gabor_filtered_image, 0, 255).astype(np.uint8)
 
 def get_image_skeletons(enhanced_image: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
@@ -127,56 +187,30 @@ def angle_mean(a: float, b: float) -> float:
     """Mean angle."""
     return math.atan2((math.sin(a) + math.sin(b)) / 2, (math.cos(a) + math.cos(b)) / 2)
 
-def calculate_minutiae(mask: np.ndarray, skeleton: np.ndarray, binary_skeleton: np.ndarray) -> List[Tuple[int, int, bool, float]]:
-    """Calculate minutiae points with angles. Full implementation with all nested funcs."""
-    crossed_number = np.array(crossing_number_kernel())
-    chebyshev = chebyshev_kernel()
-    euclidean = euclidean_kernel()
-    crossing_numbers = np.array([np.count_nonzero(n < np.roll(n, -1)) for n in chebyshev]).astype(np.uint8)
-    chebyshev_filter_applied = cv2.filter2D(binary_skeleton, -1, crossed_number, borderType=cv2.BORDER_CONSTANT)
-    crossing_numbers_transformed = cv2.LUT(chebyshev_filter_applied, crossing_numbers)
+def calculate_minutiae(mask: np.ndarray, skeleton: np.ndarray, binary_skeleton: np.ndarray) -> np.ndarray:
+    """Calculate minutiae points with angles.
+
+    Candidates (crossing number 1 or 3, more than 10 px inside the mask) are found with vectorized
+    OpenCV/NumPy; their ridges are traced by the compiled kernel in ridge_tracing in one call. The
+    lookup tables come from the process-wide MinutiaeExtractorTables.
+
+    Returns:
+        Structured array (x, y, termination, theta) with ridge_tracing.MINUTIA_RECORD_DTYPE.
+    """
+    from minutiae_tables import get_extractor_tables
+    from ridge_tracing import trace_minutiae
+
+    tables = get_extractor_tables()
+    chebyshev_filter_applied = cv2.filter2D(binary_skeleton, -1, tables.crossing_number_kernel,
+                                            borderType=cv2.BORDER_CONSTANT)
+    crossing_numbers_transformed = cv2.LUT(chebyshev_filter_applied, tables.crossing_numbers)
     crossing_numbers_transformed[skeleton == 0] = 0
-    minutiae = [(x, y, crossing_numbers_transformed[y, x] == 1)
-                for y, x in zip(*np.where(np.isin(crossing_numbers_transformed, [1, 3])))]
+    ys, xs = np.where(np.isin(crossing_numbers_transformed, [1, 3]))
     mask_distance = cv2.distanceTransform(
         cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT),
         cv2.DIST_C,
         3)[1:-1, 1:-1]
-    filtered_minutiae = list(filter(lambda m: mask_distance[m[1], m[0]] > 10, minutiae))
-    next_directions = [[next_ridge_directions(previous_distance, neighbour) for previous_distance in range(9)]
-                       for neighbour in chebyshev]
-
-    def get_ridge_angle(x, y, direction=8):
-        current_x, current_y, current_distance = x, y, direction
-        length = 0.0
-        while length < 20:
-            possible_next_directions = next_directions[chebyshev_filter_applied[current_y, current_x]][current_distance]
-            if len(possible_next_directions) == 0:
-                break
-            if any(crossing_numbers_transformed[
-                       current_y + euclidean[next_direction][1],
-                       current_x + euclidean[next_direction][0]] != 2
-                   for next_direction in possible_next_directions):
-                break
-            current_distance = possible_next_directions[0]
-            delta_x, delta_y, delta_distance = euclidean[current_distance]
-            current_x += delta_x
-            current_y += delta_y
-            length += delta_distance
-        return math.atan2(-current_y + y, current_x - x) if length >= 10 else None
-
-    def get_angle(x, y, termination):
-        if termination:
-            return get_ridge_angle(x, y)
-        directions = next_directions[chebyshev_filter_applied[y, x]][8]
-        if len(directions) != 3:
-            return None
-        angles = [get_ridge_angle(x, y, direction) for direction in directions]
-        if any(a is None for a in angles):
-            return None
-        angle1, angle2 = min(((angles[i], angles[(i + 1) % 3]) for i in range(3)),
-                             key=lambda t: angle_abs_difference(t[0], t[1]))
-        return angle_mean(angle1, angle2)
-
-    minutiae_with_angles = map(lambda m: (m[0], m[1], m[2], get_angle(m[0], m[1], m[2])), filtered_minutiae)
-    return list(filter(lambda m: m[3] is not None, minutiae_with_angles))
\ No newline at end of file
+    inside = mask_distance[ys, xs] > 10
+    ys, xs = ys[inside], xs[inside]
+    return trace_minutiae(xs, ys, crossing_numbers_transformed[ys, xs] == 1,
+                          chebyshev_filter_applied, crossing_numbers_transformed, tables)
@@ -1,16 +1,28 @@
-import io
+import os
+import threading
 import time
 import numpy as np
 import boto3
 from typing import Dict, Optional
 
-dynamodb = boto3.resource('dynamodb')
+from template_codec import decode_minutiae, encode_minutiae, records_from_legacy_array
+
+# boto3 resources are not thread-safe, and records are written from the pipeline's I/O threads
+_thread_local = threading.local()
+
+
+def get_dynamodb_resource():
+    """Returns a DynamoDB resource owned by the calling thread."""
+    if not hasattr(_thread_local, 'dynamodb'):
+        _thread_local.dynamodb = boto3.session.Session().resource('dynamodb')
+    return _thread_local.dynamodb
 
 
 def save_minutiae_to_dynamo(table_name: str, image_id: str, array: np.ndarray, metadata: Dict, group_id: Optional[str] = None, ttl_seconds: Optional[int] = None) -> None:
-    """Save or update minutiae as compressed binary to DynamoDB.
+    """Save or update minutiae as a binary template (template_codec) to DynamoDB.
     
-    For publication: Optimized for size (compressed), reusable for dataset (persistent) or query (TTL).
+    For publication: Compact fixed-size records the comparator decodes without inflating or copying,
+    reusable for dataset (persistent) or query (TTL). TEMPLATE_QUANTIZED=1 stores int16/uint16 fields.
     Updates existing item if ImageId exists, creates new otherwise.
     
     Args:
@@ -20,13 +32,11 @@ def save_minutiae_to_dynamo(table_name: str, image_id: str, array: np.ndarray, m
         metadata: Dict with shifts/offsets/centroid (converted to Decimal for floats).
         ttl_seconds: Expire time for query table (None for persistent).
     """
-    buffer = io.BytesIO()
-    np.savez_compressed(buffer, data=array)
-    buffer.seek(0)
+    quantized = os.environ.get('TEMPLATE_QUANTIZED', '0') == '1'
     
     item = {
         'ImageId': image_id,
-        'MinutiaeBinary': buffer.getvalue(),
+        'MinutiaeBinary': encode_minutiae(records_from_legacy_array(array), quantized=quantized),
         'Metadata': metadata,
         'Timestamp': int(time.time())
     }
@@ -38,7 +48,7 @@ def save_minutiae_to_dynamo(table_name: str, image_id: str, array: np.ndarray, m
         item['TTL'] = int(time.time() + ttl_seconds)
     
     try:
-        table = dynamodb.Table(table_name)
+        table = get_dynamodb_resource().Table(table_name)
         table.update_item(
             Key={'ImageId': image_id},
             UpdateExpression="SET MinutiaeBinary = :mb, GroupId = :gi, Metadata = :md, #ts = :ts" + (", TTL = :ttl" if ttl_seconds else ""),
@@ -56,7 +66,7 @@ def save_minutiae_to_dynamo(table_name: str, image_id: str, array: np.ndarray, m
 
 def save_group_to_dynamo(table_name: str, group_id: Optional[str] = None) -> None:    
     try:
-        dynamodb.Table(table_name).update_item(
+        get_dynamodb_resource().Table(table_name).update_item(
             Key={'GroupId': group_id},
             UpdateExpression="SET #ts = :ts",
             ExpressionAttributeValues={':ts': int(time.time())},
@@ -66,12 +76,11 @@ def save_group_to_dynamo(table_name: str, group_id: Optional[str] = None) -> Non
         raise RuntimeError(f"Failed to save/update {group_id} to {table_name}: {str(e)}")
 
 def load_minutiae_from_dynamo(table_name: str, image_id: str) -> np.ndarray:
-    """Load and decompress minutiae. Reuse for comparator."""
+    """Load and decode minutiae records (x, y, theta, quality, type). Reuse for comparator."""
     try:
-        response = dynamodb.Table(table_name).get_item(Key={'ImageId': image_id})
+        response = get_dynamodb_resource().Table(table_name).get_item(Key={'ImageId': image_id})
         if 'Item' not in response:
             raise ValueError(f"No item for {image_id} in {table_name}")
-        buffer = io.BytesIO(response['Item']['MinutiaeBinary'])
-        return np.load(buffer)['data']
+        return decode_minutiae(response['Item']['MinutiaeBinary'].value)
     except Exception as e:
         raise RuntimeError(f"Failed to load {image_id}: {str(e)}")
\ No newline at end of file
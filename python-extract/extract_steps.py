@@ -1,6 +1,9 @@
+import time
+from typing import Optional
+
 import numpy as np
 from cv_filter_utils import calculate_image_sobel_gradients, create_binary_mask, get_local_ridge_orientations, \
-    get_local_ridge_frequency, get_enhanced_image, get_crop_indices
+    get_local_ridge_frequency, get_enhanced_image, get_crop_indices, get_image_skeletons, calculate_minutiae
 
 def crop_image(image: np.ndarray) -> tuple[np.ndarray, int, int, int, int]:
     """Crop fingerprint to active region. Reusable for dataset/input."""
@@ -26,17 +29,15 @@ def get_centroid(minutiae):
     Publication: Based on .NET GetSquares for consistent minutiae alignment.
     
     Args:
-        minutiae: List of (x, y, is_termination, theta).
+        minutiae: Structured array (x, y, termination, theta) from calculate_minutiae.
     
     Returns:
         (center_x, center_y).
     """
-    if not minutiae:
+    if len(minutiae) == 0:
         return 0.0, 0.0
     
-    points = np.array([(x, y) for x, y, _, _ in minutiae])
-    center_x, center_y = np.mean(points, axis=0)
-    return int(center_x), int(center_y)
+    return int(np.mean(minutiae['x'])), int(np.mean(minutiae['y']))
 
 def shift_minutiae(minutiae: np.ndarray, shift_x: int, shift_y: int) -> np.ndarray:
     """Shift minutiae coordinates by given offsets.
@@ -55,4 +56,56 @@ def shift_minutiae(minutiae: np.ndarray, shift_x: int, shift_y: int) -> np.ndarr
     shifted = minutiae.copy()
     shifted[:, 0] -= shift_x
     shifted[:, 1] -= shift_y
-    return shifted
\ No newline at end of file
+    return shifted
+
+
+def extract_template(image: np.ndarray, timings: Optional[dict] = None) -> tuple[np.ndarray, dict]:
+    """Run the full extraction on a grayscale image: crop, enhance, skeletonize, minutiae, centroid, shift.
+
+    Reuse: Shared by the S3 Lambda handler and offline tools working on local files.
+
+    Args:
+        image: Grayscale fingerprint image.
+        timings: Optional dict filled with 'crop', 'enhance', 'skeleton' and 'minutiae' step times in ms.
+
+    Returns:
+        (minutiae_array, metadata): np.array [n,4] (X,Y,IsTermination,Theta) in cropped coordinates and
+        the Metadata dict stored with the template (shifts, offsets, center).
+    """
+    timings = {} if timings is None else timings
+
+    step_start = time.time()
+    crop, row, column, row_offset, column_offset = crop_image(image)
+    timings['crop'] = (time.time() - step_start) * 1000
+
+    step_start = time.time()
+    enhanced, mask = create_enhanced_version(crop)
+    timings['enhance'] = (time.time() - step_start) * 1000
+
+    step_start = time.time()
+    skeleton, binary_skeleton = get_image_skeletons(enhanced)
+    timings['skeleton'] = (time.time() - step_start) * 1000
+
+    step_start = time.time()
+    minutiae = calculate_minutiae(mask, skeleton, binary_skeleton)
+    timings['minutiae'] = (time.time() - step_start) * 1000
+
+    center_x, center_y = get_centroid(minutiae)
+
+    minutiae_array = np.column_stack([
+        minutiae['x'], minutiae['y'], minutiae['termination'], minutiae['theta']
+    ]).astype(np.float32).reshape(-1, 4)
+
+    minutiae_array = shift_minutiae(minutiae_array, int(column), int(row))
+    center_x -= int(column)
+    center_y -= int(row)
+
+    metadata = {
+        'width_shift': int(column),
+        'height_shift': int(row),
+        'offset_row': int(row_offset),
+        'offset_col': int(column_offset),
+        'center_x': center_x,
+        'center_y': center_y
+    }
+    return minutiae_array, metadata
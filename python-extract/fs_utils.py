@@ -1,19 +1,50 @@
-import os
+import threading
 import cv2
 import numpy as np
 import boto3
 
 s3_client = boto3.client('s3')
 
+# Тело объекта читается порциями в буфер потока, который переиспользуется между изображениями
+READ_CHUNK_SIZE = 256 * 1024
+_buffers = threading.local()
+
+
+def _read_buffer(size: int) -> bytearray:
+    """Per-thread buffer of at least size bytes; grows only when a larger object arrives."""
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None or len(buffer) < size:
+        buffer = _buffers.buffer = bytearray(max(size, READ_CHUNK_SIZE))
+    return buffer
+
+
+def decode_image(data, key: str) -> np.ndarray:
+    """Decode encoded image bytes (TIFF, PNG, ...) to grayscale."""
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError(f"Failed to read {key}")
+    return img
+
+
 def read_file_as_opencv(bucket: str, key: str) -> np.ndarray:
-    """Read image from S3 as grayscale. Reusable for dataset/input."""
-    temp_path = f"/tmp/{os.path.basename(key)}"
+    """Read image from S3 as grayscale. Reusable for dataset/input.
+
+    The object body is streamed into a reusable in-memory buffer and decoded with cv2.imdecode,
+    so nothing is written to /tmp and concurrent records with the same basename cannot collide.
+    """
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    size = response['ContentLength']
+    buffer = _read_buffer(size)
+    view = memoryview(buffer)
+    offset = 0
+    body = response['Body']
     try:
-        s3_client.download_file(bucket, key, temp_path)
-        img = cv2.imread(temp_path, cv2.IMREAD_GRAYSCALE)
-        if img is None:
-            raise ValueError(f"Failed to read {key}")
-        return img
+        for chunk in body.iter_chunks(READ_CHUNK_SIZE):
+            if offset + len(chunk) > len(buffer):
+                raise ValueError(f"Object {key} is larger than its ContentLength {size}")
+            view[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
     finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
\ No newline at end of file
+        body.close()
+    # imdecode копирует пиксели, поэтому буфер можно сразу отдавать следующему изображению
+    return decode_image(view[:offset], key)
@@ -0,0 +1,134 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from extract_steps import extract_template
+
+logger = logging.getLogger(__name__)
+
+CPU_BACKENDS = ('serial', 'thread', 'process')
+
+
+def _extract_with_timings(image: np.ndarray) -> tuple:
+    """Runs extract_template in a CPU worker and returns its step timings with the result."""
+    timings = {}
+    minutiae_array, metadata = extract_template(image, timings)
+    return minutiae_array, metadata, timings
+
+
+class RecordPipeline:
+    """
+    Pipelined executor for S3 records: I/O stages on a thread pool, CPU stages on a bounded pool.
+
+    Each record is driven by an I/O thread (S3 read, DynamoDB writes, S3 delete) that hands the
+    decoded image to the CPU pool for extraction, so network waits of some records overlap the
+    extraction of others while at most cpu_workers extractions run at once. Both pools live for
+    the container lifetime.
+
+    The process pool is created lazily from an I/O thread, so its workers are started through a
+    forkserver rather than forked from a parent with running threads (boto3, Numba's threading layer).
+    """
+
+    def __init__(self, io_workers: int = 8, cpu_backend: str = 'process', cpu_workers: int = None):
+        if cpu_backend not in CPU_BACKENDS:
+            raise ValueError(f"Unknown CPU backend '{cpu_backend}', expected one of {CPU_BACKENDS}")
+        self.io_workers = max(1, io_workers)
+        self.cpu_backend = cpu_backend
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1
+        self._io_pool = None
+        self._cpu_pool = None
+        self._lock = threading.Lock()
+
+    def _get_io_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._io_pool is None:
+                self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix='record-io')
+            return self._io_pool
+
+    def _get_cpu_pool(self):
+        """Creates the CPU pool on first use and keeps it for the container lifetime."""
+        with self._lock:
+            if self._cpu_pool is None:
+                if self.cpu_backend == 'process':
+                    try:
+                        self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers,
+                                                             mp_context=multiprocessing.get_context('forkserver'))
+                    except (OSError, ValueError) as e:
+                        # AWS Lambda has no /dev/shm, so multiprocessing primitives are unavailable
+                        logger.warning(f"Process pool unavailable ({e}), falling back to thread backend")
+                        self.cpu_backend = 'thread'
+                if self.cpu_backend == 'thread':
+                    self._cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers,
+                                                        thread_name_prefix='record-cpu')
+            return self._cpu_pool
+
+    def extract(self, image: np.ndarray, timings: dict) -> tuple:
+        """
+        extract_template on the CPU pool; blocks the calling I/O thread until it finishes.
+
+        Args:
+            image: Grayscale fingerprint image
+            timings: Dict filled with the extraction step times in ms
+
+        Returns:
+            (minutiae_array, metadata) as from extract_template
+        """
+        pool = self._get_cpu_pool()
+        try:
+            minutiae_array, metadata, step_timings = pool.submit(_extract_with_timings, image).result()
+        except BrokenProcessPool:
+            # Drop the broken pool so the next record starts a fresh one
+            self.shutdown_cpu()
+            raise
+        timings.update(step_timings)
+        return minutiae_array, metadata
+
+    def map(self, fn, items: list) -> list:
+        """
+        Applies fn to every item on the I/O pool and returns the results in item order.
+
+        With the serial backend, or for a single item where there is nothing to overlap, items run
+        one after another in the calling thread.
+        """
+        if self.cpu_backend == 'serial' or len(items) <= 1:
+            return [fn(item, extract_template) for item in items]
+        pool = self._get_io_pool()
+        futures = [pool.submit(fn, item, self.extract) for item in items]
+        return [future.result() for future in futures]
+
+    def shutdown_cpu(self) -> None:
+        """Shuts the CPU pool down; a new one is created for the next record."""
+        with self._lock:
+            if self._cpu_pool is not None:
+                self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+                self._cpu_pool = None
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> RecordPipeline:
+    """
+    Returns the process-wide record pipeline, creating it once per warm container.
+
+    Configured through EXTRACT_IO_WORKERS, EXTRACT_CPU_BACKEND (serial/thread/process) and
+    EXTRACT_CPU_WORKERS environment variables.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            cpu_workers = int(os.environ.get('EXTRACT_CPU_WORKERS', '0'))
+            _pipeline = RecordPipeline(
+                io_workers=int(os.environ.get('EXTRACT_IO_WORKERS', '8')),
+                cpu_backend=os.environ.get('EXTRACT_CPU_BACKEND', 'process'),
+                cpu_workers=cpu_workers or None
+            )
+            logger.info(f"Record pipeline created: io_workers={_pipeline.io_workers}, "
+                        f"cpu_backend={_pipeline.cpu_backend}, cpu_workers={_pipeline.cpu_workers}")
+        return _pipeline
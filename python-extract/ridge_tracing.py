@@ -0,0 +1,136 @@
+import math
+
+import numpy as np
+from numba import njit
+
+from minutiae_tables import NO_DIRECTION, MinutiaeExtractorTables, get_extractor_tables
+
+# Минуция после трассировки: координаты, тип и направление гребня
+MINUTIA_RECORD_DTYPE = np.dtype([('x', np.int32), ('y', np.int32), ('termination', np.bool_), ('theta', np.float64)])
+
+# Длина трассировки гребня: не дальше MAX_RIDGE_LENGTH, угол принимается от MIN_RIDGE_LENGTH
+MIN_RIDGE_LENGTH = 10.0
+MAX_RIDGE_LENGTH = 20.0
+
+TRACE_RIDGE_SIGNATURE = ('float64(int64, int64, int64, uint8[:, ::1], uint8[:, ::1], int8[:, :, ::1], '
+                         'int32[::1], int32[::1], float64[::1])')
+TRACE_ANGLES_SIGNATURE = ('float64[::1](int32[::1], int32[::1], bool_[::1], uint8[:, ::1], uint8[:, ::1], '
+                          'int8[:, :, ::1], int32[::1], int32[::1], float64[::1])')
+
+
+@njit(TRACE_RIDGE_SIGNATURE, cache=True, nogil=True)
+def trace_ridge(x, y, direction, codes, crossing_numbers, table, step_x, step_y, step_length):
+    """
+    Walks along the ridge from (x, y) while it stays a plain ridge (crossing number 2).
+
+    Returns:
+        Ridge angle from the start to the last reached point, or NaN if the ridge is shorter than MIN_RIDGE_LENGTH
+    """
+    height, width = crossing_numbers.shape
+    current_x, current_y, current_direction = x, y, direction
+    length = 0.0
+    while length < MAX_RIDGE_LENGTH:
+        candidates = table[codes[current_y, current_x], current_direction]
+        if candidates[0] < 0:
+            break
+        stop = False
+        for k in range(candidates.shape[0]):
+            next_direction = candidates[k]
+            if next_direction < 0:
+                break
+            next_x = current_x + step_x[next_direction]
+            next_y = current_y + step_y[next_direction]
+            # Соседи за краем изображения считаются концом гребня
+            if (next_x < 0 or next_y < 0 or next_x >= width or next_y >= height
+                    or crossing_numbers[next_y, next_x] != 2):
+                stop = True
+                break
+        if stop:
+            break
+        current_direction = candidates[0]
+        current_x += step_x[current_direction]
+        current_y += step_y[current_direction]
+        length += step_length[current_direction]
+    if length < MIN_RIDGE_LENGTH:
+        return np.nan
+    return math.atan2(-current_y + y, current_x - x)
+
+
+@njit(TRACE_ANGLES_SIGNATURE, cache=True, nogil=True)
+def trace_angles(xs, ys, terminations, codes, crossing_numbers, table, step_x, step_y, step_length):
+    """
+    Ridge angle of every candidate minutia in one call.
+
+    A termination takes the angle of its single ridge. A bifurcation traces its three ridges and
+    takes the mean of the two closest angles (the first such pair on ties).
+
+    Returns:
+        float64 array of angles, NaN where the candidate is rejected
+    """
+    angles = np.full(xs.shape[0], np.nan)
+    branch_angles = np.empty(3)
+    for i in range(xs.shape[0]):
+        x = np.int64(xs[i])
+        y = np.int64(ys[i])
+        if terminations[i]:
+            angles[i] = trace_ridge(x, y, NO_DIRECTION, codes, crossing_numbers, table, step_x, step_y, step_length)
+            continue
+
+        directions = table[codes[y, x], NO_DIRECTION]
+        # Ветвление - ровно три гребня из точки
+        if directions[2] < 0 or directions[3] >= 0:
+            continue
+        valid = True
+        for k in range(3):
+            branch_angles[k] = trace_ridge(x, y, np.int64(directions[k]), codes, crossing_numbers, table,
+                                           step_x, step_y, step_length)
+            if np.isnan(branch_angles[k]):
+                valid = False
+                break
+        if not valid:
+            continue
+
+        best = 0
+        best_difference = np.inf
+        for k in range(3):
+            a = branch_angles[k]
+            b = branch_angles[(k + 1) % 3]
+            difference = math.pi - abs(abs(a - b) - math.pi)
+            if difference < best_difference:
+                best = k
+                best_difference = difference
+        a = branch_angles[best]
+        b = branch_angles[(best + 1) % 3]
+        angles[i] = math.atan2((math.sin(a) + math.sin(b)) / 2, (math.cos(a) + math.cos(b)) / 2)
+    return angles
+
+
+def trace_minutiae(xs: np.ndarray, ys: np.ndarray, terminations: np.ndarray, codes: np.ndarray,
+                   crossing_numbers: np.ndarray, tables: MinutiaeExtractorTables = None) -> np.ndarray:
+    """
+    Traces all candidate minutiae and keeps those with a ridge angle.
+
+    Args:
+        xs, ys: Candidate coordinates.
+        terminations: True for ridge endings, False for bifurcations.
+        codes: 8-neighbourhood code of every skeleton pixel (crossing_number_kernel filter).
+        crossing_numbers: Crossing number of every skeleton pixel (0 off the skeleton).
+        tables: Lookup tables; the process-wide get_extractor_tables() by default.
+
+    Returns:
+        Structured array with MINUTIA_RECORD_DTYPE, in candidate order.
+    """
+    tables = tables or get_extractor_tables()
+    xs = np.ascontiguousarray(xs, dtype=np.int32)
+    ys = np.ascontiguousarray(ys, dtype=np.int32)
+    terminations = np.ascontiguousarray(terminations, dtype=np.bool_)
+    angles = trace_angles(xs, ys, terminations, np.ascontiguousarray(codes, dtype=np.uint8),
+                          np.ascontiguousarray(crossing_numbers, dtype=np.uint8), tables.direction_table,
+                          tables.step_x, tables.step_y, tables.step_length)
+    accepted = ~np.isnan(angles)
+    minutiae = np.empty(int(accepted.sum()), dtype=MINUTIA_RECORD_DTYPE)
+    minutiae['x'] = xs[accepted]
+    minutiae['y'] = ys[accepted]
+    minutiae['termination'] = terminations[accepted]
+    minutiae['theta'] = angles[accepted]
+    return minutiae
@@ -0,0 +1,154 @@
+"""
+Binary minutiae template format shared by the extractor and the comparator.
+
+Keep python-extract/template_codec.py and python-compare/template_codec.py identical.
+
+Layout (little-endian):
+    header  magic b'FPMT' | version uint8 | layout uint8 | record_size uint16 | count uint32   (12 bytes)
+    records count × record_size bytes, contiguous
+
+LAYOUT_FLOAT32 records are decoded without copying (np.frombuffer over a memoryview);
+LAYOUT_QUANTIZED stores int16/uint16 fields for smaller items and is widened on decode.
+"""
+import io
+import math
+import struct
+
+import numpy as np
+
+MAGIC = b'FPMT'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHI')
+
+LAYOUT_FLOAT32 = 0
+LAYOUT_QUANTIZED = 1
+
+# Same fields as MINUTIA_DTYPE_BASE in the comparator, with explicit byte order
+TEMPLATE_DTYPE = np.dtype([
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('theta', '<f4'),
+    ('quality', '<f4'),
+    ('type', '<i4')
+])
+
+QUANTIZED_DTYPE = np.dtype([
+    ('x', '<i2'),
+    ('y', '<i2'),
+    ('theta', '<i2'),
+    ('quality', '<u2'),
+    ('type', '<u2')
+])
+
+LAYOUT_DTYPES = {
+    LAYOUT_FLOAT32: TEMPLATE_DTYPE,
+    LAYOUT_QUANTIZED: QUANTIZED_DTYPE
+}
+
+THETA_SCALE = 32767 / math.pi
+QUALITY_SCALE = 65535.0
+
+
+def records_from_legacy_array(array: np.ndarray) -> np.ndarray:
+    """
+    Converts the extractor's [n,4] float array (X, Y, IsTermination, Theta) into template records.
+
+    Args:
+        array: np.array [n,4].
+
+    Returns:
+        Structured array with TEMPLATE_DTYPE (quality is 0).
+    """
+    array = np.asarray(array, dtype=np.float32).reshape(-1, 4)
+    records = np.zeros(len(array), dtype=TEMPLATE_DTYPE)
+    records['x'] = array[:, 0]
+    records['y'] = array[:, 1]
+    records['type'] = array[:, 2].astype(np.int32)
+    records['theta'] = array[:, 3]
+    return records
+
+
+def encode_minutiae(records: np.ndarray, quantized: bool = False) -> bytes:
+    """
+    Encodes minutiae records into the binary template format.
+
+    Args:
+        records: Structured array with x, y, theta, quality and type fields.
+        quantized: Store int16/uint16 fields (integer pixel coordinates, theta with ~1e-4 rad step,
+                   quality with 1/65535 step) instead of float32.
+
+    Returns:
+        Encoded template bytes.
+    """
+    layout = LAYOUT_QUANTIZED if quantized else LAYOUT_FLOAT32
+    dtype = LAYOUT_DTYPES[layout]
+    encoded = np.zeros(len(records), dtype=dtype)
+    if quantized:
+        encoded['x'] = np.rint(records['x'])
+        encoded['y'] = np.rint(records['y'])
+        theta = np.mod(records['theta'] + math.pi, 2 * math.pi) - math.pi
+        encoded['theta'] = np.rint(theta * THETA_SCALE)
+        encoded['quality'] = np.rint(np.clip(records['quality'], 0.0, 1.0) * QUALITY_SCALE)
+        encoded['type'] = records['type']
+    else:
+        for field in dtype.names:
+            encoded[field] = records[field]
+    return HEADER.pack(MAGIC, VERSION, layout, dtype.itemsize, len(encoded)) + encoded.tobytes()
+
+
+def is_encoded_template(data) -> bool:
+    """Checks whether the buffer starts with the template header magic."""
+    return len(data) >= HEADER.size and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def is_legacy_npz(data) -> bool:
+    """Checks whether the buffer is a legacy np.savez_compressed archive (zip local file header)."""
+    return bytes(data[:4]) == b'PK\x03\x04'
+
+
+def decode_minutiae(data) -> np.ndarray:
+    """
+    Decodes a binary template into TEMPLATE_DTYPE records.
+
+    Float32 payloads are returned as a read-only view over the input buffer (no copy); quantized
+    payloads are widened into a new array. Legacy np.savez_compressed items are still accepted.
+
+    Args:
+        data: bytes, bytearray or memoryview.
+
+    Returns:
+        Structured array with TEMPLATE_DTYPE.
+
+    Raises:
+        ValueError: If the buffer is not a valid template.
+    """
+    view = memoryview(data)
+    if is_legacy_npz(view):
+        with np.load(io.BytesIO(view)) as archive:
+            return records_from_legacy_array(archive['data'])
+    if not is_encoded_template(view):
+        raise ValueError("Not a minutiae template: header magic mismatch")
+
+    magic, version, layout, record_size, count = HEADER.unpack_from(view)
+    if version != VERSION:
+        raise ValueError(f"Unsupported template version {version}")
+    if layout not in LAYOUT_DTYPES:
+        raise ValueError(f"Unsupported template layout {layout}")
+    dtype = LAYOUT_DTYPES[layout]
+    if record_size != dtype.itemsize:
+        raise ValueError(f"Record size {record_size} does not match layout {layout} ({dtype.itemsize})")
+    expected_size = HEADER.size + count * record_size
+    if len(view) != expected_size:
+        raise ValueError(f"Template size mismatch: {len(view)} bytes, expected {expected_size} for {count} records")
+
+    encoded = np.frombuffer(view, dtype=dtype, count=count, offset=HEADER.size)
+    if layout == LAYOUT_FLOAT32:
+        return encoded
+
+    records = np.empty(count, dtype=TEMPLATE_DTYPE)
+    records['x'] = encoded['x']
+    records['y'] = encoded['y']
+    records['theta'] = encoded['theta'] / THETA_SCALE
+    records['quality'] = encoded['quality'] / QUALITY_SCALE
+    records['type'] = encoded['type']
+    return records